@@ -1,87 +1,564 @@
+import argparse
+import io
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import pandas as pd
 import psycopg2
+from psycopg2 import sql
 from sqlalchemy import create_engine
 import numpy as np
 from tqdm import tqdm
+from rollup import update_rollup
+from schema import (COLUMNS, create_schema, migrate_schema, add_time_columns, create_indexes,
+                    add_year_partitions, is_partitioned)
+from incremental import (file_fingerprint, open_csv, read_header, iter_csv_blocks,
+                         ensure_checkpoint_table, load_checkpoint, save_checkpoint)
 
-def clean_boolean(value):
-    if pd.isna(value):
-        return False
-    return str(value).lower() == 'true'
-
-def import_accident_data(csv_path):
-    # Database connection parameters
-    DB_PARAMS = {
-        "host": "localhost",
-        "database": "accidents_db",
-        "user": "postgres",
-        "password": "1234"
-    }
+# Database connection parameters
+DB_PARAMS = {
+    "host": "localhost",
+    "database": "accidents_db",
+    "user": "postgres",
+    "password": "1234"
+}
+
+def get_engine():
+    """SQLAlchemy engine for DB_PARAMS"""
+    return create_engine(f'postgresql://{DB_PARAMS["user"]}:{DB_PARAMS["password"]}@{DB_PARAMS["host"]}/{DB_PARAMS["database"]}')
+
+# Column groups normalized by clean_chunk
+BOOLEAN_COLUMNS = ['amenity', 'bump', 'crossing', 'give_way', 
+                   'junction', 'no_exit', 'railway', 'roundabout', 
+                   'station', 'stop', 'traffic_calming', 
+                   'traffic_signal', 'turning_loop']
+INTEGER_COLUMNS = ['severity', 'year', 'month', 'day', 'hour', 'dow']
+CATEGORY_COLUMNS = ['state', 'county', 'city', 'weather_condition']
+
+# Columns clean_chunk keeps, in table order (see schema.COLUMNS)
+TABLE_COLUMNS = [name for name, _ in COLUMNS]
+# Extra CSV columns already reported by this process
+_dropped_columns = set()
+
+def normalize_boolean(series):
+    """'true' in any case becomes True; anything else, missing included, False.
+
+    Only the distinct values are inspected in Python; rows are mapped back
+    through the factorized codes, with -1 (missing) landing on False.
+    """
+    if pd.api.types.is_bool_dtype(series):
+        return series.astype(bool)
+    codes, uniques = pd.factorize(series)
+    truthy = np.array([str(value).lower() == 'true' for value in uniques] + [False])
+    return pd.Series(truthy[codes], index=series.index)
+
+def normalize_types(df):
+    """Coerce a renamed chunk to compact native dtypes.
+
+    Booleans become bool, integer columns with gaps become nullable Int64,
+    low-cardinality text becomes category, and literal 'nan' strings become
+    missing values. Numeric columns keep NaN rather than being cast to
+    object, and both writers emit missing values as NULL.
+    """
+    for col in BOOLEAN_COLUMNS:
+        df[col] = normalize_boolean(df[col])
+
+    for col in INTEGER_COLUMNS:
+        if col in df.columns and not pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col]).astype('Int64')
+
+    for col in df.columns:
+        if pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].mask(df[col] == 'nan')
+
+    for col in CATEGORY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+def mark_data_changed():
+    """Bump the data version so running API processes drop cached results"""
+    with psycopg2.connect(**DB_PARAMS) as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS accidents_data_version (
+                    id INTEGER PRIMARY KEY,
+                    version BIGINT NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                )
+            """)
+            cur.execute("""
+                INSERT INTO accidents_data_version (id, version) VALUES (1, 1)
+                ON CONFLICT (id) DO UPDATE
+                SET version = accidents_data_version.version + 1, updated_at = now()
+            """)
+
+def clean_chunk(chunk, keyed=False):
+    """Normalize one raw CSV chunk into the accidents table layout.
+
+    Columns the table doesn't have are dropped, and reported the first
+    time they are seen, so an extra CSV column can't fail every COPY.
+    keyed=True drops rows without a year: the upsert matches on (id, year)
+    and NULLs never conflict, so such rows would be inserted again on
+    every rerun.
+    """
+    # Convert column names to lowercase
+    df = chunk.rename(columns=str.lower)
+    
+    # Rename columns to match PostgreSQL naming convention
+    df = df.rename(columns={
+        'distance(mi)': 'distance',
+        'temperature(f)': 'temperature',
+        'humidity(%)': 'humidity',
+        'pressure(in)': 'pressure',
+        'visibility(mi)': 'visibility',
+        'wind_direction': 'wind_direction',
+        'wind_speed(mph)': 'wind_speed',
+        'dayofweek': 'day_of_week'
+    })
+    
+    # Convert start_time to datetime
+    df['start_time'] = pd.to_datetime(df['start_time'])
+
+    # Hour and weekday buckets for the analysis routes; dow counts from
+    # Sunday = 0 like EXTRACT(DOW), pandas from Monday = 0
+    df['hour'] = df['start_time'].dt.hour
+    df['dow'] = (df['start_time'].dt.dayofweek + 1) % 7
     
+    # Booleans, nullable ints, categories and NULLs, all vectorized
+    df = normalize_types(df)
+
+    if keyed:
+        missing = df['year'].isna()
+        if missing.any():
+            print(f"\nSkipping {missing.sum():,} rows without a year")
+            df = df[~missing]
+
+    dropped = [col for col in df.columns if col not in TABLE_COLUMNS]
+    if set(dropped) - _dropped_columns:
+        _dropped_columns.update(dropped)
+        print(f"\nDropping columns not in the accidents table: {', '.join(dropped)}")
+    return df[[col for col in TABLE_COLUMNS if col in df.columns]]
+
+def iter_chunks(csv_path, chunk_size, use_mmap=False):
+    """Yield (chunk, bytes_read) pairs, reading the raw CSV exactly once.
+
+    bytes_read is the reader's position after the chunk. pandas reads
+    ahead, so it can run slightly past the chunk, which is fine for
+    progress reporting.
+    """
+    with open_csv(csv_path, use_mmap) as f:
+        for chunk in pd.read_csv(f, chunksize=chunk_size):
+            yield chunk, f.tell()
+
+def clean_block(header, block, keyed=False):
+    """Parse a block of raw CSV records (see iter_csv_blocks) and clean it"""
+    return clean_chunk(pd.read_csv(io.BytesIO(header + block)), keyed)
+
+def write_chunk_insert(df, engine, table='accidents'):
+    """Load a cleaned chunk with multi-row INSERT statements"""
+    df.to_sql(table, engine, if_exists='append', index=False, 
+             method='multi', chunksize=10000)
+
+def _prepare_copy(cur, df, engine, table):
+    """Create the table on first use and align integer columns for COPY"""
+    cur.execute("SELECT to_regclass(%s)", (table,))
+    if cur.fetchone()[0] is None:
+        cur.execute(pd.io.sql.get_schema(df, table, con=engine))
+    cur.execute("""
+        SELECT column_name FROM information_schema.columns
+        WHERE table_name = %s AND data_type IN ('smallint', 'integer', 'bigint')
+    """, (table,))
+    integer_columns = [row[0] for row in cur.fetchall()]
+
+    # A float column with gaps would be written as "5.0", which COPY (unlike
+    # INSERT) refuses for integer columns
+    converted = {
+        col: pd.to_numeric(df[col]).astype('Int64')
+        for col in integer_columns
+        if col in df.columns and not pd.api.types.is_integer_dtype(df[col])
+    }
+    if converted:
+        df = df.assign(**converted)
+    return df
+
+def _copy_into(cur, df, table):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    copy_sql = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(table),
+        sql.SQL(', ').join(sql.Identifier(col) for col in df.columns)
+    )
+    cur.copy_expert(copy_sql, buffer)
+
+def write_chunk_copy(df, conn, engine, table='accidents'):
+    """Stream a cleaned chunk through COPY FROM STDIN.
+
+    The chunk is rendered as CSV into an in-memory buffer, so no INSERT
+    statement is ever built. Missing values become unquoted empty fields,
+    which COPY reads as NULL. The table is created from the frame's values
+    on first use, with the same column types to_sql would pick.
+    """
+    try:
+        with conn.cursor() as cur:
+            df = _prepare_copy(cur, df, engine, table)
+            _copy_into(cur, df, table)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def write_chunk_upsert(df, conn, engine, on_commit=None, table='accidents'):
+    """COPY a cleaned chunk into a staging table and upsert it on (id, year).
+
+    Rows whose id is already loaded are updated in place, so loading the
+    same rows again never duplicates them. The key includes year because a
+    unique index on a partitioned table must contain the partition key.
+    on_commit(cur) runs inside the same transaction, letting the caller
+    advance its checkpoint atomically with the data. The unique index must
+    exist already (see ensure_upsert_key).
+    """
+    df = df.drop_duplicates('id', keep='last')
+    columns = sql.SQL(', ').join(sql.Identifier(col) for col in df.columns)
+    updates = sql.SQL(', ').join(
+        sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(col))
+        for col in df.columns if col not in ('id', 'year')
+    )
+    staging = f"{table}_staging"
+    try:
+        with conn.cursor() as cur:
+            df = _prepare_copy(cur, df, engine, table)
+            cur.execute(sql.SQL(
+                "CREATE TEMP TABLE {} (LIKE {} INCLUDING DEFAULTS) ON COMMIT DROP"
+            ).format(sql.Identifier(staging), sql.Identifier(table)))
+            _copy_into(cur, df, staging)
+            cur.execute(sql.SQL("""
+                INSERT INTO {table} ({columns})
+                SELECT {columns} FROM {staging}
+                ON CONFLICT (id, year) DO UPDATE SET {updates}
+            """).format(table=sql.Identifier(table), staging=sql.Identifier(staging),
+                        columns=columns, updates=updates))
+            if on_commit is not None:
+                on_commit(cur)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def ensure_upsert_key(cur, dedupe=False, table='accidents'):
+    """Create the unique (id, year) index the upsert matches on.
+
+    Tables loaded by plain appends can hold the same id twice for a year,
+    which would make the index fail to build. Those are reported with a
+    way out, or with dedupe=True removed, keeping the last copy loaded.
+    """
+    index = f"{table}_id_year_key"
+    cur.execute("SELECT to_regclass(%s)", (index,))
+    if cur.fetchone()[0] is not None:
+        return
+    cur.execute(sql.SQL("""
+        SELECT COUNT(*), COALESCE(SUM(copies - 1), 0) FROM (
+            SELECT COUNT(*) AS copies FROM {} WHERE year IS NOT NULL
+            GROUP BY id, year HAVING COUNT(*) > 1
+        ) duplicates
+    """).format(sql.Identifier(table)))
+    keys, extra = cur.fetchone()
+    if keys and not dedupe:
+        raise RuntimeError(
+            f"{table} holds {keys:,} (id, year) keys more than once ({extra:,} extra rows), "
+            f"left by earlier non-incremental imports. Rerun with --dedupe to keep the last "
+            f"copy of each, or delete the extra rows yourself before importing incrementally.")
+    if keys:
+        print(f"Removing {extra:,} duplicate rows from {table}...")
+        # Copies of a key share a year, so they sit in the same partition
+        # and ctid orders them by when they were loaded
+        cur.execute(sql.SQL("""
+            DELETE FROM {0} a USING {0} b
+            WHERE a.id = b.id AND a.year = b.year AND a.tableoid = b.tableoid
+            AND a.ctid < b.ctid
+        """).format(sql.Identifier(table)))
+    cur.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} (id, year)").format(
+        sql.Identifier(index), sql.Identifier(table)))
+
+class ChunkImportError(Exception):
+    """A chunk failed to clean or load and the import stopped there"""
+
+    def __init__(self, chunk_index, error):
+        super().__init__(f"chunk {chunk_index}: {error}")
+        self.chunk_index = chunk_index
+        self.error = error
+
+def chunk_years(df):
+    """Distinct years present in a cleaned chunk"""
+    if 'year' not in df.columns:
+        return set()
+    return {int(year) for year in df['year'].dropna().unique()}
+
+def chunk_periods(df):
+    """(year, month) pairs present in a cleaned chunk, with None for a
+    missing year or month so the rollup refreshes those rows too"""
+    if 'year' not in df.columns or 'month' not in df.columns:
+        return set()
+    periods = df[['year', 'month']].drop_duplicates()
+    return {tuple(None if pd.isna(value) else int(value) for value in period)
+            for period in periods.itertuples(index=False)}
+
+def import_chunks_pipelined(chunks, prepare, write_chunk, workers, on_written):
+    """Prepare chunks in a process pool while a writer thread loads them.
+
+    ``chunks`` yields (chunk_index, payload, meta) triples. Up to ``workers``
+    payloads are turned into frames by ``prepare`` ahead of the writer, so
+    parsing overlaps the database load. Frames are still handed to
+    write_chunk(df, meta) strictly in file order, and the first chunk that
+    fails to prepare or write stops the pipeline and is raised as
+    ChunkImportError.
+    """
+    write_queue = queue.Queue(maxsize=2)
+    writer_errors = []
+
+    def writer():
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            chunk_index, df, meta = item
+            if writer_errors:
+                # Keep draining so the reader never blocks on a full queue
+                continue
+            try:
+                write_chunk(df, meta)
+                on_written(df, meta)
+            except Exception as e:
+                writer_errors.append(ChunkImportError(chunk_index, e))
+
+    def hand_off(chunk_index, future, meta):
+        try:
+            df = future.result()
+        except Exception as e:
+            raise ChunkImportError(chunk_index, e) from e
+        write_queue.put((chunk_index, df, meta))
+
+    writer_thread = threading.Thread(target=writer, name="chunk-writer", daemon=True)
+    writer_thread.start()
+    pending = deque()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            try:
+                for chunk_index, payload, meta in chunks:
+                    if writer_errors:
+                        break
+                    pending.append((chunk_index, pool.submit(prepare, payload), meta))
+                    if len(pending) > workers:
+                        hand_off(*pending.popleft())
+                while pending and not writer_errors:
+                    hand_off(*pending.popleft())
+            finally:
+                for _, future, _ in pending:
+                    future.cancel()
+    finally:
+        write_queue.put(None)
+        writer_thread.join()
+
+    if writer_errors:
+        raise writer_errors[0]
+
+def import_accident_data(csv_path, loader='copy', workers=0, incremental=False,
+                         progress='bytes', use_mmap=False, migrate=False, dedupe=False):
+    """Import the accidents CSV in chunks.
+
+    loader='copy' streams each chunk with COPY FROM STDIN; loader='insert'
+    keeps the original to_sql multi-row INSERT path.
+
+    workers=0 cleans and writes each chunk in turn. workers>0 cleans chunks
+    in that many processes while a writer thread loads them in order.
+
+    incremental=True upserts on id and checkpoints every chunk (see
+    incremental.py), so an interrupted or repeated run resumes where the
+    last one stopped and a grown file only loads its new rows. It requires
+    the copy loader, and stops before loading anything if the table already
+    holds duplicate (id, year) keys unless dedupe=True removes them.
+
+    Without incremental, the serial path reports and skips chunks that
+    fail; the pipelined and incremental paths stop at the first failed
+    chunk and raise ChunkImportError.
+
+    progress='bytes' sizes the progress bar from the file size and the
+    reader's position, so the file is read once. progress='rows' first
+    counts the lines for an exact row total, at the cost of a second full
+    read. use_mmap reads the file through a read-only memory map.
+
+    A missing accidents table is created partitioned by year (see
+    schema.py), and each chunk's year partitions are added before it is
+    written. migrate=True first converts an existing unpartitioned table.
+    """
+    if loader not in ('copy', 'insert'):
+        raise ValueError(f"Unknown loader: {loader}")
+    if progress not in ('bytes', 'rows'):
+        raise ValueError(f"Unknown progress mode: {progress}")
+    if incremental and loader != 'copy':
+        raise ValueError("Incremental import requires the copy loader")
+    if dedupe and not incremental:
+        raise ValueError("dedupe only applies to incremental imports")
+
     print("Starting data import process...")
+
+    # Create or migrate the partitioned schema
+    schema_conn = psycopg2.connect(**DB_PARAMS)
+    if migrate:
+        migrate_schema(schema_conn)
+    else:
+        create_schema(schema_conn)
+        add_time_columns(schema_conn)
+    with schema_conn.cursor() as cur:
+        partitioned = is_partitioned(cur)
+    schema_conn.commit()
+    if not partitioned:
+        print("accidents is not partitioned; run with --migrate to convert it")
+    # Years whose partition is known to exist
+    partition_years = set()
     
     # Create SQLAlchemy engine
-    engine = create_engine(f'postgresql://{DB_PARAMS["user"]}:{DB_PARAMS["password"]}@{DB_PARAMS["host"]}/{DB_PARAMS["database"]}')
+    engine = get_engine()
+    copy_conn = psycopg2.connect(**DB_PARAMS) if loader == 'copy' else None
     
-    # Get total number of rows in CSV
-    total_rows = sum(1 for _ in open(csv_path)) - 1  # subtract 1 for header
-    print(f"Total rows to import: {total_rows:,}")
+    file_size = os.path.getsize(csv_path)
+    print(f"File size: {file_size / 2**20:,.1f} MiB")
+    total_rows = None
+    if progress == 'rows':
+        # Get total number of rows in CSV
+        total_rows = sum(1 for _ in open(csv_path)) - 1  # subtract 1 for header
+        print(f"Total rows to import: {total_rows:,}")
     
     # Initialize counter for successful imports
     imported_rows = 0
+    # (year, month) periods touched by this import, for the rollup refresh
+    imported_periods = set()
+    # Set when the import stops at a failed chunk
+    failure = None
     
     # Read CSV in chunks to handle large files
     chunk_size = 50000
-    chunks = pd.read_csv(csv_path, chunksize=chunk_size)
-    
-    for chunk in tqdm(chunks, desc="Importing data", unit="chunks"):
+
+    if incremental:
+        file_hash = file_fingerprint(csv_path)
+        with copy_conn.cursor() as cur:
+            ensure_upsert_key(cur, dedupe)
+            ensure_checkpoint_table(cur)
+            checkpoint = load_checkpoint(cur, file_hash)
+        copy_conn.commit()
+        start_chunk, start_offset, rows_done = checkpoint or (0, 0, 0)
+        if checkpoint:
+            print(f"Resuming after chunk {start_chunk - 1} "
+                  f"({rows_done:,} rows, byte {start_offset:,})")
+        if start_offset > file_size:
+            print("File is smaller than the checkpoint, starting over")
+            start_chunk, start_offset, rows_done = 0, 0, 0
+
+        header = read_header(csv_path)
+        prepare = partial(clean_block, header, keyed=True)
+        chunks = (
+            (chunk_index, block, (chunk_index, end_offset))
+            for chunk_index, (block, end_offset) in enumerate(
+                iter_csv_blocks(csv_path, chunk_size, start_offset, use_mmap), start_chunk)
+        )
+
+        def write_chunk(df, meta):
+            chunk_index, end_offset = meta
+
+            def advance_checkpoint(cur):
+                save_checkpoint(cur, file_hash, csv_path, chunk_index + 1, end_offset,
+                                rows_done + imported_rows + len(df))
+
+            write_chunk_upsert(df, copy_conn, engine, on_commit=advance_checkpoint)
+    else:
+        start_offset = 0
+        prepare = clean_chunk
+        chunks = (
+            (chunk_index, chunk, (chunk_index, bytes_read))
+            for chunk_index, (chunk, bytes_read) in enumerate(
+                iter_chunks(csv_path, chunk_size, use_mmap))
+        )
+
+        def write_chunk(df, meta):
+            if loader == 'copy':
+                write_chunk_copy(df, copy_conn, engine)
+            else:
+                write_chunk_insert(df, engine)
+
+    if partitioned:
+        load_chunk = write_chunk
+
+        def write_chunk(df, meta):
+            # Rows for a year without a partition would land in the default
+            # partition and block that year's partition from being created
+            years = chunk_years(df) - partition_years
+            if years:
+                with schema_conn.cursor() as cur:
+                    add_year_partitions(cur, years)
+                schema_conn.commit()
+                partition_years.update(years)
+            load_chunk(df, meta)
+
+    if total_rows is None:
+        progress_bar = tqdm(desc="Importing data", total=file_size, initial=start_offset,
+                            unit="B", unit_scale=True, unit_divisor=1024)
+    else:
+        progress_bar = tqdm(desc="Importing data", total=total_rows, unit="rows")
+
+    def on_written(df, meta):
+        nonlocal imported_rows
+        imported_rows += len(df)
+        imported_periods.update(chunk_periods(df))
+        if total_rows is None:
+            _, bytes_read = meta
+            progress_bar.update(min(bytes_read, file_size) - progress_bar.n)
+        else:
+            progress_bar.update(len(df))
+
+    if workers > 0:
         try:
-            # Clean up the data
-            df = chunk.copy()
-            
-            # Convert column names to lowercase
-            df.columns = df.columns.str.lower()
-            
-            # Rename columns to match PostgreSQL naming convention
-            df = df.rename(columns={
-                'distance(mi)': 'distance',
-                'temperature(f)': 'temperature',
-                'humidity(%)': 'humidity',
-                'pressure(in)': 'pressure',
-                'visibility(mi)': 'visibility',
-                'wind_direction': 'wind_direction',
-                'wind_speed(mph)': 'wind_speed',
-                'DayOfWeek': 'day_of_week'
-            })
-            
-            # Convert boolean columns
-            boolean_columns = ['amenity', 'bump', 'crossing', 'give_way', 
-                             'junction', 'no_exit', 'railway', 'roundabout', 
-                             'station', 'stop', 'traffic_calming', 
-                             'traffic_signal', 'turning_loop']
-            
-            for col in boolean_columns:
-                df[col] = df[col].apply(clean_boolean)
-            
-            # Convert start_time to datetime
-            df['start_time'] = pd.to_datetime(df['start_time'])
-            
-            # Replace 'nan' strings with None/NULL
-            df = df.replace({np.nan: None, 'nan': None})
-            
-            # Import to PostgreSQL
-            df.to_sql('accidents', engine, if_exists='append', index=False, 
-                     method='multi', chunksize=10000)
-            
-            # Update counter
-            imported_rows += len(df)
-            
-        except Exception as e:
-            print(f"\nError importing chunk: {str(e)}")
-            continue
+            import_chunks_pipelined(chunks, prepare, write_chunk, workers, on_written)
+        except ChunkImportError as e:
+            failure = e
+            print(f"\nError importing {str(e)}")
+    else:
+        for chunk_index, payload, meta in chunks:
+            try:
+                # Clean up the data
+                df = prepare(payload)
+                
+                # Import to PostgreSQL
+                write_chunk(df, meta)
+                
+                # Update counter
+                on_written(df, meta)
+                
+            except Exception as e:
+                print(f"\nError importing chunk {chunk_index}: {str(e)}")
+                if incremental:
+                    # Stop so the checkpoint still points at this chunk
+                    failure = ChunkImportError(chunk_index, e)
+                    break
+                continue
+    progress_bar.close()
+
+    if copy_conn is not None:
+        copy_conn.close()
+    schema_conn.close()
 
-    print(f"\nImport completed!")
-    print(f"Successfully imported {imported_rows:,} rows out of {total_rows:,} total rows")
+    if failure is None:
+        print(f"\nImport completed!")
+    else:
+        print(f"\nImport stopped at chunk {failure.chunk_index}!")
+    if total_rows is None:
+        print(f"Successfully imported {imported_rows:,} rows")
+    else:
+        print(f"Successfully imported {imported_rows:,} rows out of {total_rows:,} total rows")
     
     # Verify final count in database
     try:
@@ -93,5 +570,53 @@ def import_accident_data(csv_path):
     except Exception as e:
         print(f"Error verifying final count: {str(e)}")
 
+    # Build the API's indexes after the bulk load (see schema.INDEXES) and
+    # refresh the planner statistics they are chosen by
+    try:
+        with psycopg2.connect(**DB_PARAMS) as conn:
+            with conn.cursor() as cur:
+                create_indexes(cur)
+                cur.execute("ANALYZE accidents")
+    except Exception as e:
+        print(f"Error creating API indexes: {str(e)}")
+
+    # Keep the pre-aggregated rollup in step with the new rows
+    try:
+        update_rollup(DB_PARAMS, imported_periods)
+    except Exception as e:
+        print(f"Error updating rollup: {str(e)}")
+
+    # Invalidate API query caches
+    if imported_rows:
+        try:
+            mark_data_changed()
+        except Exception as e:
+            print(f"Error bumping data version: {str(e)}")
+
+    if failure is not None:
+        raise failure
+
 if __name__ == "__main__":
-    import_accident_data("accidents.csv")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Import the US accidents CSV into PostgreSQL")
+    parser.add_argument("csv_path", nargs="?", default="accidents.csv")
+    parser.add_argument("--loader", choices=["copy", "insert"], default="copy",
+                        help="COPY FROM STDIN (default) or to_sql multi-row INSERTs")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="clean chunks in this many processes while a writer thread "
+                             "loads them (default: 0, serial)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="upsert on id and resume from the last checkpoint for this file")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="with --incremental, first remove ids loaded more than once "
+                             "for the same year by earlier imports")
+    parser.add_argument("--progress", choices=["bytes", "rows"], default="bytes",
+                        help="track progress by bytes read (default, single pass) or by "
+                             "rows, which counts the file's lines first")
+    parser.add_argument("--mmap", action="store_true",
+                        help="read the CSV through a memory map")
+    parser.add_argument("--migrate", action="store_true",
+                        help="convert an existing unpartitioned accidents table first")
+    args = parser.parse_args()
+    import_accident_data(args.csv_path, loader=args.loader, workers=args.workers,
+                         incremental=args.incremental, progress=args.progress,
+                         use_mmap=args.mmap, migrate=args.migrate, dedupe=args.dedupe)
\ No newline at end of file
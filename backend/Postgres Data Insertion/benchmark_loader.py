@@ -0,0 +1,56 @@
+"""Compare the COPY loader with the to_sql multi-row INSERT loader.
+
+Cleans the first --rows rows of the CSV once, then loads them into a
+scratch table with each loader and reports throughput:
+
+    python benchmark_loader.py accidents.csv --rows 200000
+"""
+import argparse
+import time
+import pandas as pd
+import psycopg2
+from Data import DB_PARAMS, get_engine, clean_chunk, write_chunk_copy, write_chunk_insert
+
+SCRATCH_TABLE = "accidents_loader_bench"
+
+def benchmark(csv_path, rows, chunk_size):
+    engine = get_engine()
+    chunks = [clean_chunk(chunk) for chunk in
+              pd.read_csv(csv_path, chunksize=chunk_size, nrows=rows)]
+    print(f"Loaded {sum(len(df) for df in chunks):,} rows in {len(chunks)} chunk(s)")
+
+    timings = {}
+    with psycopg2.connect(**DB_PARAMS) as conn:
+        for loader in ("insert", "copy"):
+            with conn.cursor() as cur:
+                cur.execute(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}")
+            conn.commit()
+
+            start = time.perf_counter()
+            for df in chunks:
+                if loader == "copy":
+                    write_chunk_copy(df, conn, engine, table=SCRATCH_TABLE)
+                else:
+                    write_chunk_insert(df, engine, table=SCRATCH_TABLE)
+            elapsed = time.perf_counter() - start
+
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT COUNT(*) FROM {SCRATCH_TABLE}")
+                count = cur.fetchone()[0]
+            conn.commit()
+            timings[loader] = elapsed
+            print(f"{loader:>6}: {count:,} rows in {elapsed:.2f}s ({count / elapsed:,.0f} rows/s)")
+
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {SCRATCH_TABLE}")
+        conn.commit()
+
+    print(f"COPY speedup: {timings['insert'] / timings['copy']:.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("csv_path", nargs="?", default="accidents.csv")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    args = parser.parse_args()
+    benchmark(args.csv_path, args.rows, args.chunk_size)
@@ -0,0 +1,61 @@
+"""Benchmark the importer's read path on a cold page cache.
+
+Compares the old two-pass read (count lines for the progress total, then
+parse) with the single-pass byte-progress reader, with and without mmap.
+Only reading and parsing are timed; nothing is written to the database.
+Before each run the file's pages are dropped from the page cache with
+posix_fadvise(DONTNEED), which needs no root:
+
+    python benchmark_progress.py accidents.csv --repeat 3
+"""
+import argparse
+import os
+import time
+import pandas as pd
+from Data import iter_chunks
+
+CHUNK_SIZE = 50000
+
+def drop_page_cache(path):
+    with open(path, 'rb') as f:
+        os.fsync(f.fileno())
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+def two_pass(csv_path):
+    total_rows = sum(1 for _ in open(csv_path)) - 1
+    rows = sum(len(chunk) for chunk in pd.read_csv(csv_path, chunksize=CHUNK_SIZE))
+    assert rows == total_rows
+    return rows
+
+def single_pass(csv_path, use_mmap=False):
+    return sum(len(chunk) for chunk, _ in iter_chunks(csv_path, CHUNK_SIZE, use_mmap))
+
+def benchmark(csv_path, repeat):
+    readers = [
+        ("two-pass", lambda: two_pass(csv_path)),
+        ("single-pass", lambda: single_pass(csv_path)),
+        ("single-pass mmap", lambda: single_pass(csv_path, use_mmap=True))
+    ]
+    size = os.path.getsize(csv_path)
+    print(f"{csv_path}: {size / 2**20:,.1f} MiB, best of {repeat} cold-cache runs")
+    best = {}
+    for name, read in readers:
+        timings = []
+        for _ in range(repeat):
+            drop_page_cache(csv_path)
+            start = time.perf_counter()
+            rows = read()
+            timings.append(time.perf_counter() - start)
+        best[name] = min(timings)
+        print(f"{name:>17}: {best[name]:6.2f}s  {rows:,} rows  "
+              f"{size / 2**20 / best[name]:6.1f} MiB/s")
+    baseline = best["two-pass"]
+    for name in ("single-pass", "single-pass mmap"):
+        print(f"{name} saves {1 - best[name] / baseline:.0%} of the two-pass time")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("csv_path", nargs="?", default="accidents.csv")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    benchmark(args.csv_path, args.repeat)
@@ -0,0 +1,139 @@
+"""Pre-aggregated rollup of the accidents table.
+
+One row per (state, county, city, year, month, day, hour, dow, severity,
+weather_condition) cell holding the accident count, severity sum and the
+lat/lng extent of the cell. All of these merge with SUM/MIN/MAX, so the API
+can answer COUNT/AVG(severity) queries over any combination of the key
+columns without touching the raw table.
+"""
+import psycopg2
+
+ROLLUP_TABLE = "accidents_rollup"
+
+CREATE_ROLLUP_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+        state TEXT,
+        county TEXT,
+        city TEXT,
+        year INTEGER,
+        month SMALLINT,
+        day SMALLINT,
+        hour SMALLINT,
+        dow SMALLINT,
+        severity SMALLINT,
+        weather_condition TEXT,
+        accident_count BIGINT NOT NULL,
+        severity_sum BIGINT,
+        min_lat DOUBLE PRECISION,
+        max_lat DOUBLE PRECISION,
+        min_lng DOUBLE PRECISION,
+        max_lng DOUBLE PRECISION
+    );
+    CREATE INDEX IF NOT EXISTS {ROLLUP_TABLE}_state_county_idx
+        ON {ROLLUP_TABLE} (state, county, year, month);
+    CREATE INDEX IF NOT EXISTS {ROLLUP_TABLE}_year_month_idx
+        ON {ROLLUP_TABLE} (year, month);
+"""
+
+# Aggregates raw accidents into rollup cells; {where} narrows the source rows
+AGGREGATE_SQL = f"""
+    INSERT INTO {ROLLUP_TABLE}
+    SELECT
+        state,
+        county,
+        city,
+        year,
+        month,
+        day,
+        hour,
+        dow,
+        severity,
+        weather_condition,
+        COUNT(*) as accident_count,
+        SUM(severity) as severity_sum,
+        MIN(start_lat) as min_lat,
+        MAX(start_lat) as max_lat,
+        MIN(start_lng) as min_lng,
+        MAX(start_lng) as max_lng
+    FROM accidents
+    WHERE {{where}}
+    GROUP BY state, county, city, year, month, day, hour, dow, severity, weather_condition
+"""
+
+PERIODS_SQL = "(year, month) IN (SELECT * FROM unnest(%s::int[], %s::int[]))"
+
+
+def _period_sql(year, month):
+    """(condition, params) matching one period whose year or month may be
+    None, written so the (year, month, ...) indexes still apply"""
+    conditions, params = [], []
+    for column, value in (("year", year), ("month", month)):
+        if value is None:
+            conditions.append(f"{column} IS NULL")
+        else:
+            conditions.append(f"{column} = %s")
+            params.append(int(value))
+    return " AND ".join(conditions), params
+
+
+def rollup_exists(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass(%s)", (ROLLUP_TABLE,))
+        return cur.fetchone()[0] is not None
+
+
+def build_rollup(conn):
+    """Rebuild the whole rollup from the accidents table"""
+    with conn.cursor() as cur:
+        cur.execute(CREATE_ROLLUP_SQL)
+        cur.execute(f"TRUNCATE {ROLLUP_TABLE}")
+        cur.execute(AGGREGATE_SQL.format(where="TRUE"))
+        cur.execute(f"ANALYZE {ROLLUP_TABLE}")
+    conn.commit()
+
+
+def refresh_rollup(conn, periods):
+    """Recompute only the rollup cells for the given (year, month) periods.
+
+    Cells are keyed by year and month, so dropping and re-aggregating the
+    touched months keeps the rollup exact after rows are appended. A year
+    or month of None stands for rows where it is NULL; those periods are
+    matched with IS NULL, since they never equal anything in the IN list.
+    """
+    if not periods:
+        return
+    dated = sorted(period for period in periods if None not in period)
+    conditions, params = [], []
+    if dated:
+        conditions.append(PERIODS_SQL)
+        params += [[int(year) for year, _ in dated], [int(month) for _, month in dated]]
+    for year, month in periods:
+        if year is None or month is None:
+            condition, condition_params = _period_sql(year, month)
+            conditions.append(condition)
+            params += condition_params
+    where = " OR ".join(f"({condition})" for condition in conditions)
+    with conn.cursor() as cur:
+        cur.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE {where}", params)
+        cur.execute(AGGREGATE_SQL.format(where=where), params)
+        cur.execute(f"ANALYZE {ROLLUP_TABLE}")
+    conn.commit()
+
+
+def update_rollup(db_params, periods):
+    """Build the rollup if it is missing, otherwise refresh the given periods"""
+    with psycopg2.connect(**db_params) as conn:
+        if rollup_exists(conn):
+            print(f"Refreshing {ROLLUP_TABLE} for {len(periods)} month(s)...")
+            refresh_rollup(conn, periods)
+        else:
+            print(f"Building {ROLLUP_TABLE}...")
+            build_rollup(conn)
+
+
+if __name__ == "__main__":
+    from Data import DB_PARAMS
+
+    with psycopg2.connect(**DB_PARAMS) as conn:
+        print(f"Rebuilding {ROLLUP_TABLE}...")
+        build_rollup(conn)
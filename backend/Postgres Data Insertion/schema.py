@@ -0,0 +1,438 @@
+"""Schema and migrations for the accidents table.
+
+accidents is range-partitioned by year, one partition per year plus a
+default partition for rows without one, so filters on year only touch the
+matching partitions. Indexes are declared on the parent and cascade to
+every partition:
+
+- (state, county, year, month) for the state and county views
+- (state, county, city) for the city and street drill-downs
+- (year, month, day) for the national map filters
+- (state, county, hour, dow) for the hour and weekday analyses
+- BRIN on start_time for time ranges, tiny since rows arrive in time order
+- (start_time, id) for keyset pagination in /api/accidents
+- the hash sample key used by the national map (api/utils/sampling.py)
+
+Run directly to create or migrate the schema, or to check with EXPLAIN
+that the API routes' queries use these indexes:
+
+    python schema.py [--migrate] [--check]
+"""
+import argparse
+import json
+import os
+import sys
+
+import psycopg2
+from psycopg2 import sql
+
+TABLE = "accidents"
+DEFAULT_PARTITION = f"{TABLE}_default"
+
+COLUMNS = [
+    ("id", "TEXT"),
+    ("source", "TEXT"),
+    ("severity", "SMALLINT"),
+    ("start_time", "TIMESTAMP"),
+    ("end_time", "TIMESTAMP"),
+    ("start_lat", "DOUBLE PRECISION"),
+    ("start_lng", "DOUBLE PRECISION"),
+    ("end_lat", "DOUBLE PRECISION"),
+    ("end_lng", "DOUBLE PRECISION"),
+    ("distance", "DOUBLE PRECISION"),
+    ("description", "TEXT"),
+    ("street", "TEXT"),
+    ("city", "TEXT"),
+    ("county", "TEXT"),
+    ("state", "TEXT"),
+    ("zipcode", "TEXT"),
+    ("country", "TEXT"),
+    ("timezone", "TEXT"),
+    ("airport_code", "TEXT"),
+    ("weather_timestamp", "TIMESTAMP"),
+    ("temperature", "DOUBLE PRECISION"),
+    ("wind_chill(f)", "DOUBLE PRECISION"),
+    ("humidity", "DOUBLE PRECISION"),
+    ("pressure", "DOUBLE PRECISION"),
+    ("visibility", "DOUBLE PRECISION"),
+    ("wind_direction", "TEXT"),
+    ("wind_speed", "DOUBLE PRECISION"),
+    ("precipitation(in)", "DOUBLE PRECISION"),
+    ("weather_condition", "TEXT"),
+    ("amenity", "BOOLEAN"),
+    ("bump", "BOOLEAN"),
+    ("crossing", "BOOLEAN"),
+    ("give_way", "BOOLEAN"),
+    ("junction", "BOOLEAN"),
+    ("no_exit", "BOOLEAN"),
+    ("railway", "BOOLEAN"),
+    ("roundabout", "BOOLEAN"),
+    ("station", "BOOLEAN"),
+    ("stop", "BOOLEAN"),
+    ("traffic_calming", "BOOLEAN"),
+    ("traffic_signal", "BOOLEAN"),
+    ("turning_loop", "BOOLEAN"),
+    ("sunrise_sunset", "TEXT"),
+    ("civil_twilight", "TEXT"),
+    ("nautical_twilight", "TEXT"),
+    ("astronomical_twilight", "TEXT"),
+    ("year", "INTEGER"),
+    ("month", "SMALLINT"),
+    ("day", "SMALLINT"),
+    ("hour", "SMALLINT"),
+    ("dow", "SMALLINT"),
+]
+
+# Columns derived from start_time, with the SQL that computes them. dow
+# counts from Sunday = 0, as EXTRACT(DOW) does.
+TIME_COLUMNS = {
+    "hour": "EXTRACT(HOUR FROM start_time)::smallint",
+    "dow": "EXTRACT(DOW FROM start_time)::smallint",
+}
+
+# Must match SAMPLE_KEY_SQL in api/utils/sampling.py
+SAMPLE_KEY_SQL = "(hashtext(id) & 2147483647)"
+
+# (name, method, key)
+INDEXES = [
+    (f"{TABLE}_state_county_year_month_idx", "btree", "(state, county, year, month)"),
+    (f"{TABLE}_state_county_city_idx", "btree", "(state, county, city)"),
+    (f"{TABLE}_year_month_day_idx", "btree", "(year, month, day)"),
+    (f"{TABLE}_state_county_hour_dow_idx", "btree", "(state, county, hour, dow)"),
+    (f"{TABLE}_start_time_brin_idx", "brin", "(start_time)"),
+    (f"{TABLE}_start_time_id_idx", "btree", "(start_time, id)"),
+    (f"{TABLE}_sample_key_idx", "btree", f"({SAMPLE_KEY_SQL})"),
+]
+
+
+def table_exists(cur, table=TABLE):
+    cur.execute("SELECT to_regclass(%s)", (table,))
+    return cur.fetchone()[0] is not None
+
+
+def is_partitioned(cur, table=TABLE):
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)
+        )
+    """, (table,))
+    return cur.fetchone()[0]
+
+
+def partition_name(year):
+    return f"{TABLE}_y{year}"
+
+
+def create_table(cur):
+    """Create the partitioned parent and its default partition if missing"""
+    columns = sql.SQL(", ").join(
+        sql.SQL("{} {}").format(sql.Identifier(name), sql.SQL(column_type))
+        for name, column_type in COLUMNS
+    )
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} ({}) PARTITION BY RANGE (year)").format(
+        sql.Identifier(TABLE), columns))
+    cur.execute(sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} DEFAULT").format(
+        sql.Identifier(DEFAULT_PARTITION), sql.Identifier(TABLE)))
+
+
+def add_year_partitions(cur, years):
+    """Create the yearly partitions that don't exist yet.
+
+    Must run before rows for a new year are loaded; a year that already has
+    rows in the default partition cannot get its own partition.
+    """
+    for year in sorted(years):
+        cur.execute(sql.SQL(
+            "CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)"
+        ).format(sql.Identifier(partition_name(year)), sql.Identifier(TABLE)),
+            (year, year + 1))
+
+
+def create_indexes(cur):
+    for name, method, key in INDEXES:
+        cur.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} USING {} {}").format(
+            sql.Identifier(name), sql.Identifier(TABLE), sql.SQL(method), sql.SQL(key)))
+
+
+def add_time_columns(conn):
+    """Add and backfill the TIME_COLUMNS on a table created before them.
+
+    Adding the columns and filling them commit together, so a table that
+    has them is always fully backfilled.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_name = %s AND column_name = ANY(%s)
+        """, (TABLE, list(TIME_COLUMNS)))
+        existing = {row[0] for row in cur.fetchall()}
+        missing = [name for name in TIME_COLUMNS if name not in existing]
+        if missing:
+            print(f"Backfilling {', '.join(missing)} from start_time...")
+            for name in missing:
+                cur.execute(sql.SQL("ALTER TABLE {} ADD COLUMN {} SMALLINT").format(
+                    sql.Identifier(TABLE), sql.Identifier(name)))
+            cur.execute(sql.SQL("UPDATE {} SET {}").format(
+                sql.Identifier(TABLE),
+                sql.SQL(", ").join(
+                    sql.SQL("{} = {}").format(sql.Identifier(name), sql.SQL(TIME_COLUMNS[name]))
+                    for name in missing
+                )))
+            print(f"Updated {cur.rowcount:,} rows")
+    conn.commit()
+
+
+def create_schema(conn):
+    """Create the partitioned table if there is no accidents table yet.
+
+    Indexes are left to create_indexes so a first bulk load isn't slowed
+    down by maintaining them.
+    """
+    with conn.cursor() as cur:
+        if not table_exists(cur):
+            print(f"Creating partitioned {TABLE} table...")
+            create_table(cur)
+    conn.commit()
+
+
+def migrate_schema(conn):
+    """Move an existing unpartitioned accidents table into the partitioned
+    layout, converting columns to the declared types, in one transaction,
+    then add any missing time columns and build the indexes.
+    """
+    with conn.cursor() as cur:
+        if not table_exists(cur):
+            create_table(cur)
+        elif not is_partitioned(cur):
+            legacy = f"{TABLE}_legacy"
+            print(f"Migrating {TABLE} to a table partitioned by year...")
+            cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                sql.Identifier(TABLE), sql.Identifier(legacy)))
+            cur.execute("""
+                SELECT column_name FROM information_schema.columns
+                WHERE table_name = %s
+            """, (legacy,))
+            legacy_columns = {row[0] for row in cur.fetchall()}
+            dropped = legacy_columns - {name for name, _ in COLUMNS}
+            if dropped:
+                print(f"Dropping columns not in the schema: {', '.join(sorted(dropped))}")
+
+            create_table(cur)
+            cur.execute(sql.SQL("SELECT DISTINCT year FROM {} WHERE year IS NOT NULL").format(
+                sql.Identifier(legacy)))
+            add_year_partitions(cur, [int(row[0]) for row in cur.fetchall()])
+
+            # Time columns the legacy table lacks are derived on the way over
+            names, values = [], []
+            for name, column_type in COLUMNS:
+                if name in legacy_columns:
+                    names.append(name)
+                    values.append(sql.SQL("{}::{}").format(sql.Identifier(name),
+                                                           sql.SQL(column_type)))
+                elif name in TIME_COLUMNS:
+                    names.append(name)
+                    values.append(sql.SQL(TIME_COLUMNS[name]))
+            cur.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+                sql.Identifier(TABLE),
+                sql.SQL(", ").join(sql.Identifier(name) for name in names),
+                sql.SQL(", ").join(values),
+                sql.Identifier(legacy)))
+            print(f"Moved {cur.rowcount:,} rows")
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(legacy)))
+    conn.commit()
+
+    add_time_columns(conn)
+    with conn.cursor() as cur:
+        print("Creating indexes...")
+        create_indexes(cur)
+        cur.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(TABLE)))
+    conn.commit()
+
+
+STATE_COUNTY_INDEXES = (f"{TABLE}_state_county_year_month_idx",
+                         f"{TABLE}_state_county_city_idx",
+                         f"{TABLE}_state_county_hour_dow_idx")
+
+# Share of the table the hash sample check asks map-data for
+SAMPLE_CHECK_FRACTION = 0.01
+
+
+def _estimate_rows(cur, where_clause, params):
+    # The planner's estimate, as the map-data route sizes its sample from
+    cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM {TABLE} WHERE {where_clause}", params)
+    plan = cur.fetchone()[0]
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def index_checks(cur, sample):
+    """(route, query, params, expected indexes) for the API's queries.
+
+    Each query comes from the builder its route calls, with filters as the
+    route compiles them for a request matching the sample row. A plan
+    should use at least one of the expected indexes.
+    """
+    # The API package sits next to this directory
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from api.routes.accident_routes import DEFAULT_FIELDS, build_keyset_query, select_list
+    from api.routes.analysis_routes import build_ranking_query
+    from api.routes.county_time_routes import TIME_BUCKETS, build_time_analysis_query
+    from api.routes.spatial_routes import build_bin_query, build_points_query
+    from api.routes.state_routes import _accident_query
+    from api.utils.mercator import world_size
+    from api.utils.query_builders import FilterCompiler, QueryBuilder
+    from api.utils.sampling import sample_threshold
+
+    def map_filters(**dates):
+        filters = FilterCompiler().add("start_lat IS NOT NULL").add("start_lng IS NOT NULL")
+        for column, value in dates.items():
+            filters.values(column, [value])
+        return filters.compile()
+
+    def points(where_clause, params, sample_size):
+        threshold = sample_threshold(_estimate_rows(cur, where_clause, params), sample_size)
+        if threshold is None:
+            return build_points_query(where_clause, ""), params + [sample_size]
+        return (build_points_query(where_clause, f"AND {SAMPLE_KEY_SQL} < %s"),
+                params + [threshold, sample_size])
+
+    checks = []
+
+    where_clause, params = (FilterCompiler().values('year', [sample["year"]])
+                            .values('month', [sample["month"]])
+                            .equals('state', sample["state"]).compile())
+    checks.append(("/api/state/details", _accident_query(where_clause, 'all'), params,
+                   STATE_COUNTY_INDEXES))
+
+    where_clause, params = (FilterCompiler().equals('county', sample["county"])
+                            .equals('state', sample["state"])
+                            .values('year', [sample["year"]]).compile())
+    checks.append(("/api/county/time-analysis",
+                   build_time_analysis_query(TIME_BUCKETS['hour'], where_clause, 'top'),
+                   params + [5, 5], STATE_COUNTY_INDEXES))
+
+    where_clause, params = (FilterCompiler().equals('county', sample["county"])
+                            .equals('state', sample["state"])
+                            .between('hour', sample["hour"], sample["hour"]).compile())
+    checks.append(("/api/analysis/cities", build_ranking_query('city', where_clause, 10),
+                   params, (f"{TABLE}_state_county_hour_dow_idx",)))
+
+    where_clause, params = (FilterCompiler().equals('city', sample["city"])
+                            .equals('county', sample["county"])
+                            .equals('state', sample["state"])
+                            .between('hour', sample["hour"], sample["hour"]).compile())
+    checks.append(("/api/analysis/streets", build_ranking_query('street', where_clause, 15),
+                   params, STATE_COUNTY_INDEXES))
+
+    where_clause, params = map_filters(year=sample["year"], month=sample["month"],
+                                       day=sample["day"])
+    query, point_params = points(where_clause, params, 300000)
+    checks.append(("/api/spatial/map-data", query, point_params,
+                   (f"{TABLE}_year_month_day_idx",)))
+    world = world_size(4)
+    checks.append(("/api/spatial/map-data?aggregate=hex", build_bin_query('hex', where_clause),
+                   [world, world] + params + [20, 20], (f"{TABLE}_year_month_day_idx",)))
+
+    where_clause, params = map_filters()
+    sample_size = max(int(_estimate_rows(cur, where_clause, params) * SAMPLE_CHECK_FRACTION), 1)
+    query, point_params = points(where_clause, params, sample_size)
+    checks.append((f"/api/spatial/map-data?sample_size={sample_size}", query, point_params,
+                   (f"{TABLE}_sample_key_idx",)))
+
+    filters = FilterCompiler()
+    filters.add("start_lng >= %s", -180.0).add("start_lng < %s", 180.0)
+    filters.add("start_lat > %s", -90.0).add("start_lat <= %s", 90.0)
+    filters.values('year', [sample["year"]]).values('month', [sample["month"]])
+    filters.values('day', [sample["day"]])
+    where_clause, params = filters.compile()
+    world = world_size(0)
+    checks.append(("/api/spatial/tiles/0/0/0", build_bin_query('grid', where_clause),
+                   [world, world] + params + [8.0, 8.0], (f"{TABLE}_year_month_day_idx",)))
+
+    where_clause, params = QueryBuilder.build_filter_conditions({})
+    checks.append(("/api/accidents?cursor=...",
+                   build_keyset_query(select_list(DEFAULT_FIELDS), where_clause,
+                                      (sample["start_time"], sample["id"])),
+                   params + [sample["start_time"], sample["id"], 1001],
+                   (f"{TABLE}_start_time_id_idx",)))
+    return checks
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+def check_indexes(conn):
+    """EXPLAIN each route's query (see index_checks) and report the indexes
+    and partitions its plan touches. Returns the number of routes whose
+    plan uses none of the expected indexes.
+    """
+    failures = 0
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT id, state, county, city, year, month, day, hour, start_time
+            FROM {TABLE}
+            WHERE state IS NOT NULL AND county IS NOT NULL AND city IS NOT NULL
+            AND year IS NOT NULL AND month IS NOT NULL AND day IS NOT NULL
+            AND hour IS NOT NULL AND start_time IS NOT NULL
+            LIMIT 1
+        """)
+        row = cur.fetchone()
+        if row is None:
+            print("No rows to check against")
+            return 0
+        sample = dict(zip(["id", "state", "county", "city", "year", "month", "day",
+                           "hour", "start_time"], row))
+
+        cur.execute("""
+            SELECT count(*) FROM pg_inherits WHERE inhparent = to_regclass(%s)
+        """, (TABLE,))
+        partitions = cur.fetchone()[0]
+
+        for name, query, params, expected in index_checks(cur, sample):
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            nodes = list(_plan_nodes(plan[0]["Plan"]))
+            relations = {node["Relation Name"] for node in nodes if "Relation Name" in node}
+
+            # Partitions carry generated index names; report their parent's
+            indexes = set()
+            for index in {node["Index Name"] for node in nodes if "Index Name" in node}:
+                cur.execute("SELECT pg_partition_root(to_regclass(%s))::regclass::text",
+                            (index,))
+                indexes.add(cur.fetchone()[0] or index)
+
+            used = bool(indexes.intersection(expected))
+            if not used:
+                failures += 1
+            scanned = f"{len(relations)} of {partitions} partitions" if partitions else \
+                f"{len(relations)} table(s)"
+            print(f"{'OK  ' if used else 'MISS'} {name}: "
+                  f"{', '.join(sorted(indexes)) or 'no index'} ({scanned})")
+    return failures
+
+
+if __name__ == "__main__":
+    from Data import DB_PARAMS
+
+    parser = argparse.ArgumentParser(description="Create or check the accidents schema")
+    parser.add_argument("--migrate", action="store_true",
+                        help="convert an unpartitioned accidents table and build the indexes")
+    parser.add_argument("--check", action="store_true",
+                        help="EXPLAIN the API routes' queries and report index use")
+    args = parser.parse_args()
+
+    with psycopg2.connect(**DB_PARAMS) as conn:
+        if args.migrate:
+            migrate_schema(conn)
+        else:
+            create_schema(conn)
+            add_time_columns(conn)
+            with conn.cursor() as cur:
+                create_indexes(cur)
+            conn.commit()
+        if args.check and check_indexes(conn):
+            raise SystemExit(1)
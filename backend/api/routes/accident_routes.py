@@ -1,45 +1,254 @@
-from flask import Blueprint, request, jsonify
-from api.utils.database import execute_query
+from flask import Blueprint, after_this_request, request, jsonify
+from api.utils.database import stream_query
+from api.utils.handlers import Query, query_handler
+from api.utils.pagination import InvalidCursor, decode_cursor, encode_cursor
 from api.utils.query_builders import QueryBuilder
+from api.utils.streaming import NDJSON_MIME_TYPE, json_stream, ndjson_stream
+from config.config import Config
 
 accident_bp = Blueprint('accidents', __name__)
 
+COUNT_MODES = ('exact', 'estimate', 'none')
+
+# Columns that may be requested with fields=
+ACCIDENT_COLUMNS = (
+    'id', 'source', 'severity', 'start_time', 'end_time', 'start_lat', 'start_lng',
+    'end_lat', 'end_lng', 'distance', 'description', 'street', 'city', 'county',
+    'state', 'zipcode', 'country', 'timezone', 'airport_code', 'weather_timestamp',
+    'temperature', 'wind_chill(f)', 'humidity', 'pressure', 'visibility',
+    'wind_direction', 'wind_speed', 'precipitation(in)', 'weather_condition',
+    'amenity', 'bump', 'crossing', 'give_way', 'junction', 'no_exit', 'railway',
+    'roundabout', 'station', 'stop', 'traffic_calming', 'traffic_signal',
+    'turning_loop', 'sunrise_sunset', 'civil_twilight', 'nautical_twilight',
+    'astronomical_twilight', 'year', 'month', 'day', 'hour', 'dow'
+)
+
+# Returned when fields= is not given
+DEFAULT_FIELDS = (
+    'id', 'start_time', 'severity', 'state', 'county', 'city',
+    'weather_condition', 'start_lat', 'start_lng'
+)
+
+# Always selected, since the continuation cursor is built from them
+KEY_FIELDS = ('id', 'start_time')
+
+def parse_fields(value):
+    """Validated column list for fields=, or None if a name is unknown.
+
+    fields=all selects every column. id and start_time are always included.
+    """
+    if not value:
+        fields = list(DEFAULT_FIELDS)
+    elif value == 'all':
+        fields = list(ACCIDENT_COLUMNS)
+    else:
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        if any(field not in ACCIDENT_COLUMNS for field in fields):
+            return None
+    fields = [field for field in KEY_FIELDS if field not in fields] + fields
+    return list(dict.fromkeys(fields))
+
+def select_list(fields):
+    # Names come from ACCIDENT_COLUMNS; quoting covers wind_chill(f) and friends
+    return ", ".join(f'"{field}"' for field in fields)
+
+def fetch_with_total(page_query, where_clause, params, mode):
+    """(rows, total) of a page and the rows matching its filters, fetched
+    together as a query handler step. The total is None when mode is 'none';
+    with page_query None only the total is fetched.
+
+    'exact' runs COUNT(*) and relies on the query cache for repeat pages;
+    'estimate' reads the planner's row estimate, which costs no scan.
+    """
+    if mode == 'exact':
+        total_query = f"SELECT COUNT(*) as count FROM accidents WHERE {where_clause}"
+    elif mode == 'estimate':
+        total_query = f"EXPLAIN (FORMAT JSON) SELECT 1 FROM accidents WHERE {where_clause}"
+    else:
+        rows = (yield page_query) if page_query else None
+        return rows, None
+
+    total_query = Query(total_query, params, fetch_all=False)
+    if page_query:
+        rows, result = yield [page_query, total_query]
+    else:
+        rows, result = None, (yield total_query)
+    if mode == 'exact':
+        return rows, result['count']
+    return rows, int(result['QUERY PLAN'][0]['Plan']['Plan Rows'])
+
+def build_keyset_query(columns, where_clause, after):
+    """Page query newest first, seeking past ``after``, the (start_time, id)
+    of the previous page's last row, or from the newest row when None.
+    Parameters are the filter params, the two seek values if any, then the
+    row limit.
+    """
+    seek_clause = "start_time IS NOT NULL"
+    if after is not None:
+        seek_clause += " AND (start_time, id) < (%s, %s)"
+    return f"""
+        SELECT {columns}
+        FROM accidents
+        WHERE {where_clause} AND {seek_clause}
+        ORDER BY start_time DESC, id DESC
+        LIMIT %s
+    """
+
+def take_page(rows, per_page, seen):
+    """Yield the first per_page rows, recording in seen the last one yielded
+    and whether another row follows it"""
+    seen['last'], seen['has_more'] = None, False
+    for count, row in enumerate(rows):
+        if count == per_page:
+            seen['has_more'] = True
+            return
+        seen['last'] = row
+        yield row
+
 @accident_bp.route('/api/accidents')
+@query_handler
 def get_accidents():
+    """Accidents newest first.
+
+    Pages are numbered with ``page`` (default 1) and fetched with
+    LIMIT/OFFSET, reporting ``total_pages``. ``paging=keyset`` or a
+    ``cursor`` switches to keyset paging instead: pages are walked with the
+    opaque cursor returned as ``next_cursor``, which seeks on
+    (start_time, id) so every page costs the same. ``count`` picks how the
+    total is reported: exact (the default for numbered pages), estimate
+    (the default for keyset pages) or none. ``fields`` is a comma
+    separated column list (or ``all``); a lean default is used without it.
+
+    Pages of STREAM_MIN_ROWS rows or more are written out as they are read.
+    With ``Accept: application/x-ndjson`` every matching row is streamed
+    instead, one object per line, and the paging parameters are ignored.
+    """
+    # JSON or NDJSON is picked from Accept, so every response varies on it
+    @after_this_request
+    def vary_on_accept(response):
+        response.vary.add('Accept')
+        return response
+
     try:
         # Get query parameters
-        page = int(request.args.get('page', 1))
         per_page = int(request.args.get('per_page', 1000))
-        
+        if per_page < 1:
+            return jsonify({'error': 'per_page must be positive'}), 400
+        page = request.args.get('page')
+        cursor = request.args.get('cursor')
+        paging = request.args.get('paging')
+        if paging not in (None, 'offset', 'keyset'):
+            return jsonify({'error': 'paging must be offset or keyset'}), 400
+        # Numbered pages unless keyset paging is asked for; page wins if both are
+        keyset = not page and (bool(cursor) or paging == 'keyset')
+        count_mode = request.args.get('count', 'estimate' if keyset else 'exact')
+        if count_mode not in COUNT_MODES:
+            return jsonify({'error': f"count must be one of {', '.join(COUNT_MODES)}"}), 400
+        fields = parse_fields(request.args.get('fields'))
+        if fields is None:
+            return jsonify({'error': 'Unknown column in fields'}), 400
+        columns = select_list(fields)
+
         # Build filter conditions
         where_clause, params = QueryBuilder.build_filter_conditions(request.args)
-        
-        # Calculate offset
-        offset = (page - 1) * per_page
-        
-        # Get paginated data
-        query = f"""
-            SELECT *
-            FROM accidents 
-            WHERE {where_clause}
-            ORDER BY start_time DESC
-            LIMIT %s OFFSET %s
-        """
-        
-        data = execute_query(query, params + [per_page, offset])
-        
-        # Get total count
-        count_query = f"SELECT COUNT(*) as count FROM accidents WHERE {where_clause}"
-        total = execute_query(count_query, params, fetch_all=False)['count']
-        
+
+        # NDJSON exports the whole result rather than a page
+        if (request.accept_mimetypes.best_match(['application/json', NDJSON_MIME_TYPE])
+                == NDJSON_MIME_TYPE):
+            query = f"""
+                SELECT {columns}
+                FROM accidents
+                WHERE {where_clause}
+                ORDER BY start_time DESC, id DESC
+            """
+            return ndjson_stream(stream_query(query, params))
+
+        # Big pages are streamed, so only their total is fetched up front
+        streamed = per_page >= Config.STREAM_MIN_ROWS
+
+        if not keyset:
+            page = int(page or 1)
+            if page < 1:
+                return jsonify({'error': 'page must be positive'}), 400
+
+            # Calculate offset
+            offset = (page - 1) * per_page
+
+            # Get paginated data
+            query = f"""
+                SELECT {columns}
+                FROM accidents
+                WHERE {where_clause}
+                ORDER BY start_time DESC
+                LIMIT %s OFFSET %s
+            """
+
+            page_query = Query(query, params + [per_page, offset])
+            data, total = yield from fetch_with_total(
+                None if streamed else page_query, where_clause, params, count_mode
+            )
+
+            response = {
+                'total': total,
+                'page': page,
+                'per_page': per_page
+            }
+            if total is not None:
+                response['total_pages'] = (total + per_page - 1) // per_page
+            if streamed:
+                return json_stream(response, 'data',
+                                   stream_query(page_query.query, page_query.params))
+            response['data'] = data
+            return jsonify(response)
+
+        # Seek past the last row of the previous page
+        after = None
+        if cursor:
+            try:
+                after = decode_cursor(cursor)
+            except InvalidCursor:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
+        # One extra row tells whether another page follows
+        query = build_keyset_query(columns, where_clause, after)
+        page_query = Query(query, params + list(after or ()) + [per_page + 1])
+        rows, total = yield from fetch_with_total(
+            None if streamed else page_query, where_clause, params, count_mode
+        )
+
+        if streamed:
+            seen = {}
+            return json_stream(
+                {
+                    'per_page': per_page,
+                    'total': total,
+                    'total_is_estimate': count_mode == 'estimate'
+                },
+                'data',
+                take_page(stream_query(page_query.query, page_query.params), per_page, seen),
+                lambda count: {
+                    'next_cursor': (encode_cursor(seen['last']['start_time'], seen['last']['id'])
+                                    if seen['has_more'] else None),
+                    'has_more': seen['has_more']
+                }
+            )
+
+        data = rows[:per_page]
+        has_more = len(rows) > per_page
+        next_cursor = None
+        if has_more:
+            last = data[-1]
+            next_cursor = encode_cursor(last['start_time'], last['id'])
+
         return jsonify({
             'data': data,
-            'total': total,
-            'page': page,
             'per_page': per_page,
-            'total_pages': (total + per_page - 1) // per_page
+            'next_cursor': next_cursor,
+            'has_more': has_more,
+            'total': total,
+            'total_is_estimate': count_mode == 'estimate'
         })
-        
+
     except Exception as e:
         print(f"Error in get_accidents: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Internal server error'}), 500
@@ -1,10 +1,29 @@
 from flask import Blueprint, request, jsonify
-from api.utils.database import execute_query
+from api.utils.handlers import Query, query_handler
+from api.utils.query_builders import FilterCompiler, InvalidFilter, QueryBuilder
+from api.utils.rollup import ROLLUP_TABLE, ROLLUP_COUNT, ROLLUP_AVG_SEVERITY, rollup_available
 import traceback
 
 analysis_bp = Blueprint('analysis', __name__)
 
+def build_ranking_query(column, where_clause, limit):
+    """The ``limit`` values of column with the most accidents, with their
+    accident count and average severity"""
+    return f"""
+        SELECT 
+            {column} as name,
+            COUNT(*) as accidents,
+            AVG(CAST(severity AS FLOAT))::numeric(10,2) as avg_severity
+        FROM accidents
+        WHERE {where_clause}
+        AND {column} IS NOT NULL
+        GROUP BY {column}
+        ORDER BY accidents DESC
+        LIMIT {int(limit)}
+    """
+
 @analysis_bp.route('/api/analysis/cities')
+@query_handler
 def get_city_analysis():
     try:
         # Get parameters
@@ -14,66 +33,53 @@ def get_city_analysis():
         start_time = request.args.get('startTime')
         end_time = request.args.get('endTime')
         
-        # Get filter parameters
-        years = request.args.getlist('years[]')
-        months = request.args.getlist('months[]')
-        days = request.args.getlist('days[]')
-        
         if not all([county, state, time_type, start_time, end_time]):
             return jsonify({'error': 'Missing required parameters'}), 400
 
+        # Every filter here is a rollup key, so prefer the rollup when built
+        use_rollup = yield from rollup_available()
+
         # Build base conditions
-        conditions = ["county = %s", "state = %s"]
-        params = [county, state]
+        filters = FilterCompiler().equals('county', county).equals('state', state)
 
         # Add time range condition based on time_type
         # Since we have hour, day, month columns directly, we can use them
-        if time_type == 'hour':
-            conditions.append("hour BETWEEN %s AND %s")
-        elif time_type == 'day':
-            conditions.append("dayofweek BETWEEN %s AND %s")
-        elif time_type == 'month':
-            conditions.append("month BETWEEN %s AND %s")
-        
-        params.extend([int(start_time), int(end_time)])
+        time_columns = {'hour': 'hour', 'day': 'dow', 'month': 'month'}
+        if time_type in time_columns:
+            try:
+                filters.between(time_columns[time_type], int(start_time), int(end_time))
+            except InvalidFilter as e:
+                return jsonify({'error': str(e)}), 400
+            except ValueError:
+                return jsonify({'error': 'startTime and endTime must be integers'}), 400
 
         # Add filter conditions
-        if years:
-            years = [int(year) for year in years]
-            conditions.append("year = ANY(%s)")
-            params.append(years)
-        
-        if months and time_type != 'month':
-            months = [int(month) for month in months]
-            conditions.append("month = ANY(%s)")
-            params.append(months)
-        
-        if days and time_type != 'day':
-            days = [int(day) for day in days]
-            conditions.append("day = ANY(%s)")
-            params.append(days)
+        QueryBuilder.time_filters(request.args, filters, skip=(time_type,))
 
-        where_clause = " AND ".join(conditions)
+        where_clause, params = filters.compile()
 
-        query = f"""
-            SELECT 
-                city as name,
-                COUNT(*) as accidents,
-                AVG(CAST(severity AS FLOAT))::numeric(10,2) as avg_severity
-            FROM accidents
-            WHERE {where_clause}
-            AND city IS NOT NULL
-            GROUP BY city
-            ORDER BY accidents DESC
-            LIMIT 10
-        """
+        if use_rollup:
+            query = f"""
+                SELECT 
+                    city as name,
+                    {ROLLUP_COUNT} as accidents,
+                    {ROLLUP_AVG_SEVERITY}::numeric(10,2) as avg_severity
+                FROM {ROLLUP_TABLE}
+                WHERE {where_clause}
+                AND city IS NOT NULL
+                GROUP BY city
+                ORDER BY accidents DESC
+                LIMIT 10
+            """
+        else:
+            query = build_ranking_query('city', where_clause, 10)
 
-        results = execute_query(query, params)
+        results = yield Query(query, params, tuples=True)
         
         return jsonify([{
-            'name': row['name'],
-            'accidents': int(row['accidents']),
-            'avgSeverity': float(row['avg_severity'])
+            'name': row.name,
+            'accidents': int(row.accidents),
+            'avgSeverity': float(row.avg_severity)
         } for row in results])
 
     except Exception as e:
@@ -84,6 +90,7 @@ def get_city_analysis():
         }), 500
 
 @analysis_bp.route('/api/county/time-analysis')
+@query_handler
 def get_county_time_analysis():
     try:
         # Get parameters
@@ -95,79 +102,48 @@ def get_county_time_analysis():
         years = request.args.getlist('years[]')
         months = request.args.getlist('months[]')
         days = request.args.getlist('days[]')
+        hours = request.args.getlist('hours[]')
         dayOfWeek = request.args.getlist('selectedDayOfWeek[]')  # Add this line
         
         if not all([county, state, time_type]):
             return jsonify({'error': 'Missing required parameters'}), 400
             
         # Build base conditions
-        conditions = ["county = %s", "state = %s"]
-        params = [county, state]
+        filters = FilterCompiler().equals('county', county).equals('state', state)
 
         # Add time range condition based on time_type
         if time_type == 'hour':
-            conditions.append("EXTRACT(HOUR FROM start_time) = ANY(%s)")
-            params.append([int(hour) for hour in hours] if hours else list(range(24)))
+            filters.values('hour', [int(hour) for hour in hours])
         elif time_type == 'day':
             # For day of week analysis
-            conditions.append("EXTRACT(DOW FROM start_time) = ANY(%s)")
-            params.append([int(day) for day in dayOfWeek] if dayOfWeek else list(range(7)))
+            filters.values('dow', [int(day) for day in dayOfWeek])
         elif time_type == 'month':
-            conditions.append("EXTRACT(MONTH FROM start_time) = ANY(%s)")
-            params.append([int(month) for month in months] if months else list(range(1, 13)))
+            filters.values('month', [int(month) for month in months])
 
         # Add other filters
-        if years:
-            years = [int(year) for year in years]
-            conditions.append("year = ANY(%s)")
-            params.append(years)
-        
-        if months and time_type != 'month':
-            months = [int(month) for month in months]
-            conditions.append("month = ANY(%s)")
-            params.append(months)
-        
-        if days and time_type != 'day':
-            days = [int(day) for day in days]
-            conditions.append("day = ANY(%s)")
-            params.append(days)
+        QueryBuilder.time_filters(request.args, filters, skip=(time_type,))
 
-        where_clause = " AND ".join(conditions)
+        where_clause, params = filters.compile()
 
-        # Your existing query logic but modified for day of week
-        if time_type == 'day':
-            query = f"""
-                SELECT 
-                    EXTRACT(DOW FROM start_time)::integer as time_value,
-                    COUNT(*) as accident_count
-                FROM accidents
-                WHERE {where_clause}
-                GROUP BY time_value
-                ORDER BY time_value
-            """
-        else:
-            # Your existing query for hour and month remains the same
-            query = f"""
-                SELECT 
-                    CASE 
-                        WHEN %s = 'hour' THEN EXTRACT(HOUR FROM start_time)::integer
-                        WHEN %s = 'month' THEN EXTRACT(MONTH FROM start_time)::integer
-                    END as time_value,
-                    COUNT(*) as accident_count
-                FROM accidents
-                WHERE {where_clause}
-                GROUP BY time_value
-                ORDER BY time_value
-            """
-            params = [time_type, time_type] + params
+        # Bucket on the precomputed column for the time type
+        time_column = {'hour': 'hour', 'day': 'dow', 'month': 'month'}.get(time_type, 'NULL::smallint')
+        query = f"""
+            SELECT 
+                {time_column} as time_value,
+                COUNT(*) as accident_count
+            FROM accidents
+            WHERE {where_clause}
+            GROUP BY time_value
+            ORDER BY time_value
+        """
 
-        results = execute_query(query, params)
+        results = yield Query(query, params, tuples=True)
         
         return jsonify({
             'success': True,
             'data': {
-                'timeValues': [row['time_value'] for row in results],
-                'accidentCounts': [row['accident_count'] for row in results]
+                'timeValues': [row.time_value for row in results],
+                'accidentCounts': [row.accident_count for row in results]
             },
             'metadata': {
                 'county': county,
@@ -190,6 +166,7 @@ def get_county_time_analysis():
         }), 500
 
 @analysis_bp.route('/api/analysis/streets')
+@query_handler
 def get_street_analysis():
     try:
         # Get parameters
@@ -200,67 +177,35 @@ def get_street_analysis():
         start_time = request.args.get('startTime')
         end_time = request.args.get('endTime')
         
-        # Get filter parameters
-        years = request.args.getlist('years[]')
-        months = request.args.getlist('months[]')
-        days = request.args.getlist('days[]')
-        
         if not all([city, county, state, time_type, start_time, end_time]):
             return jsonify({'error': 'Missing required parameters'}), 400
 
         # Build base conditions
-        conditions = ["city = %s", "county = %s", "state = %s"]
-        params = [city, county, state]
+        filters = FilterCompiler().equals('city', city).equals('county', county).equals('state', state)
 
         # Add time range condition based on time_type
-        if time_type == 'hour':
-            conditions.append("hour BETWEEN %s AND %s")
-        elif time_type == 'day':
-            conditions.append("dayofweek BETWEEN %s AND %s")
-        elif time_type == 'month':
-            conditions.append("month BETWEEN %s AND %s")
-        
-        params.extend([int(start_time), int(end_time)])
+        time_columns = {'hour': 'hour', 'day': 'dow', 'month': 'month'}
+        if time_type in time_columns:
+            try:
+                filters.between(time_columns[time_type], int(start_time), int(end_time))
+            except InvalidFilter as e:
+                return jsonify({'error': str(e)}), 400
+            except ValueError:
+                return jsonify({'error': 'startTime and endTime must be integers'}), 400
 
         # Add filter conditions
-        if years:
-            years = [int(year) for year in years]
-            conditions.append("year = ANY(%s)")
-            params.append(years)
-        
-        if months and time_type != 'month':
-            months = [int(month) for month in months]
-            conditions.append("month = ANY(%s)")
-            params.append(months)
-        
-        if days and time_type != 'day':
-            days = [int(day) for day in days]
-            conditions.append("day = ANY(%s)")
-            params.append(days)
+        QueryBuilder.time_filters(request.args, filters, skip=(time_type,))
 
-        where_clause = " AND ".join(conditions)
+        where_clause, params = filters.compile()
 
-        # Note: Since your sample data doesn't show a street column, 
-        # you'll need to add that to your database. For now, using a placeholder query.
-        query = f"""
-            SELECT 
-                street as name,
-                COUNT(*) as accidents,
-                AVG(CAST(severity AS FLOAT))::numeric(10,2) as avg_severity
-            FROM accidents
-            WHERE {where_clause}
-            AND street IS NOT NULL
-            GROUP BY street
-            ORDER BY accidents DESC
-            LIMIT 15
-        """
+        query = build_ranking_query('street', where_clause, 15)
 
-        results = execute_query(query, params)
+        results = yield Query(query, params, tuples=True)
         
         return jsonify([{
-            'name': row['name'],
-            'accidents': int(row['accidents']),
-            'avgSeverity': float(row['avg_severity'])
+            'name': row.name,
+            'accidents': int(row.accidents),
+            'avgSeverity': float(row.avg_severity)
         } for row in results])
 
     except Exception as e:
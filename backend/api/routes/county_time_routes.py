@@ -1,10 +1,138 @@
 from flask import Blueprint, request, jsonify
 import traceback
-from api.utils.database import execute_query
+from api.utils.handlers import Query, query_handler
+from api.utils.query_builders import FilterCompiler, QueryBuilder
 
 county_time_bp = Blueprint('county_time', __name__)
 
+# Bucket column for each timeType; the importer derives hour and dow
+# (Sunday = 0) from start_time
+TIME_BUCKETS = {
+    'hour': "hour",
+    'day': "dow",
+    'month': "month"
+}
+
+LOCATION_MODES = ('top', 'all', 'none')
+
+def build_time_analysis_query(bucket_sql, where_clause, locations):
+    """Histogram, traffic feature counts and location details in one query.
+
+    The filtered rows are read once into a narrow CTE. Grouping it by
+    GROUPING SETS ((time_value), ()) gives a row per bucket plus a total
+    row (is_total) holding the feature counts. Location details are grouped
+    per bucket outside the GROUPING SETS, so the total row builds no
+    county-wide name lists. With locations='top', two extra %s parameters
+    after the filter params bound the streets and cities listed per bucket,
+    each as {name, count} ordered by count.
+    """
+    query = f"""
+        WITH filtered_data AS MATERIALIZED (
+            SELECT
+                {bucket_sql} as time_value,
+                street,
+                city,
+                crossing,
+                junction,
+                station,
+                stop,
+                traffic_signal,
+                sunrise_sunset
+            FROM accidents 
+            WHERE {where_clause}
+        ),
+        buckets AS (
+            SELECT 
+                GROUPING(time_value) = 1 as is_total,
+                time_value,
+                COUNT(*) as accident_count,
+                COUNT(*) FILTER (WHERE crossing) as crossing_count,
+                COUNT(*) FILTER (WHERE junction) as junction_count,
+                COUNT(*) FILTER (WHERE station) as station_count,
+                COUNT(*) FILTER (WHERE stop) as stop_count,
+                COUNT(*) FILTER (WHERE traffic_signal) as signal_count,
+                COUNT(*) FILTER (WHERE sunrise_sunset = 'Day') as day_count,
+                COUNT(*) FILTER (WHERE sunrise_sunset = 'Night') as night_count
+            FROM filtered_data
+            GROUP BY GROUPING SETS ((time_value), ())
+        )
+    """
+    if locations == 'none':
+        return query + """
+        SELECT
+            *,
+            accident_count as total_accidents,
+            NULL::json as streets,
+            NULL::json as cities
+        FROM buckets
+        ORDER BY is_total, time_value
+    """
+
+    if locations == 'all':
+        # Every distinct name in each bucket
+        query += """,
+        names AS (
+            SELECT
+                time_value,
+                array_agg(DISTINCT street) as streets,
+                array_agg(DISTINCT city) as cities
+            FROM filtered_data
+            GROUP BY time_value
+        )"""
+        location_columns = """
+            names.streets,
+            names.cities"""
+        location_joins = """
+        LEFT JOIN names ON NOT buckets.is_total AND names.time_value = buckets.time_value"""
+    else:
+        # Rank names within each bucket and keep the first `top`
+        for column in ('street', 'city'):
+            query += f""",
+        top_{column} AS (
+            SELECT
+                time_value,
+                json_agg(json_build_object('name', {column}, 'count', name_count)
+                         ORDER BY rank) as names
+            FROM (
+                SELECT
+                    time_value,
+                    {column},
+                    COUNT(*) as name_count,
+                    row_number() OVER (
+                        PARTITION BY time_value ORDER BY COUNT(*) DESC, {column}
+                    ) as rank
+                FROM filtered_data
+                WHERE {column} IS NOT NULL
+                GROUP BY time_value, {column}
+            ) ranked
+            WHERE rank <= %s
+            GROUP BY time_value
+        )"""
+        location_columns = """
+            top_street.names as streets,
+            top_city.names as cities"""
+        location_joins = """
+        LEFT JOIN top_street ON NOT buckets.is_total AND top_street.time_value = buckets.time_value
+        LEFT JOIN top_city ON NOT buckets.is_total AND top_city.time_value = buckets.time_value"""
+    return query + f"""
+        SELECT
+            buckets.is_total,
+            buckets.time_value,
+            accident_count,
+            accident_count as total_accidents,
+            crossing_count,
+            junction_count,
+            station_count,
+            stop_count,
+            signal_count,
+            day_count,
+            night_count,{location_columns}
+        FROM buckets{location_joins}
+        ORDER BY buckets.is_total, buckets.time_value
+    """
+
 @county_time_bp.route('/api/county/time-analysis')
+@query_handler
 def get_county_time_analysis():
     try:
         # Get parameters
@@ -24,106 +152,44 @@ def get_county_time_analysis():
         if time_type not in ['hour', 'day', 'month']:
             return jsonify({'error': 'Invalid time type'}), 400
 
-        # Build base conditions
-        conditions = ["county = %s", "state = %s"]
-        params = [county, state]
+        # Build base conditions; the bucket column itself is not filtered
+        filters = FilterCompiler().equals('county', county).equals('state', state)
 
         # Add filter conditions
-        if years:
-            years = [int(year) for year in years]
-            conditions.append("year = ANY(%s)")
-            params.append(years)
-        
-        if months and time_type != 'month':
-            months = [int(month) for month in months]
-            conditions.append("month = ANY(%s)")
-            params.append(months)
-        
-        if days and time_type != 'day':
-            days = [int(day) for day in days]
-            conditions.append("day = ANY(%s)")
-            params.append(days)
+        years = QueryBuilder.int_list(request.args, 'years[]')
+        filters.values('year', years)
+
+        if time_type != 'month':
+            months = QueryBuilder.int_list(request.args, 'months[]')
+            filters.values('month', months)
+
+        if time_type != 'day':
+            days = QueryBuilder.int_list(request.args, 'days[]')
+            filters.values('day', days)
 
         # Add feature filter if specified
         if feature_filter:
             if feature_filter in ['crossing', 'junction', 'station', 'stop', 'traffic_signal']:
-                conditions.append(f"{feature_filter} = true")
+                filters.add(f"{feature_filter} = true")
             elif feature_filter in ['Day', 'Night']:
-                conditions.append(f"sunrise_sunset = %s")
-                params.append(feature_filter)
+                filters.equals('sunrise_sunset', feature_filter)
 
         # Combine conditions
-        where_clause = " AND ".join(conditions)
-
-        # Get traffic features statistics
-        stats_query = f"""
-            WITH filtered_data AS (
-                SELECT *
-                FROM accidents 
-                WHERE {where_clause}
-            )
-            SELECT 
-                COUNT(CASE WHEN crossing = true THEN id END) as crossing_count,
-                COUNT(CASE WHEN junction = true THEN id END) as junction_count,
-                COUNT(CASE WHEN station = true THEN id END) as station_count,
-                COUNT(CASE WHEN stop = true THEN id END) as stop_count,
-                COUNT(CASE WHEN traffic_signal = true THEN id END) as signal_count,
-                COUNT(CASE WHEN sunrise_sunset = 'Day' THEN id END) as day_count,
-                COUNT(CASE WHEN sunrise_sunset = 'Night' THEN id END) as night_count,
-                COUNT(DISTINCT id) as total_accidents
-            FROM filtered_data
-        """
-
-        # Build time query based on time type with filtered data
-        if time_type == 'hour':
-            query = f"""
-                WITH filtered_data AS (
-                    SELECT *
-                    FROM accidents 
-                    WHERE {where_clause}
-                )
-                SELECT 
-                    EXTRACT(HOUR FROM start_time)::integer as time_value,
-                    COUNT(*) as accident_count,
-                    array_agg(DISTINCT street) as streets,
-                    array_agg(DISTINCT city) as cities
-                FROM filtered_data
-                GROUP BY time_value
-                ORDER BY time_value
-            """
-        elif time_type == 'day':
-            query = f"""
-                WITH filtered_data AS (
-                    SELECT *
-                    FROM accidents 
-                    WHERE {where_clause}
-                )
-                SELECT 
-                    EXTRACT(DOW FROM start_time)::integer as time_value,
-                    COUNT(*) as accident_count,
-                    array_agg(DISTINCT street) as streets,
-                    array_agg(DISTINCT city) as cities
-                FROM filtered_data
-                GROUP BY time_value
-                ORDER BY time_value
-            """
-        else:  # month
-            query = f"""
-                WITH filtered_data AS (
-                    SELECT *
-                    FROM accidents 
-                    WHERE {where_clause}
-                )
-                SELECT 
-                    EXTRACT(MONTH FROM start_time)::integer as time_value,
-                    COUNT(*) as accident_count,
-                    array_agg(DISTINCT street) as streets,
-                    array_agg(DISTINCT city) as cities
-                FROM filtered_data
-                GROUP BY time_value
-                ORDER BY time_value
-            """
-        results = execute_query(query, params)
+        where_clause, params = filters.compile()
+
+        # Per-bucket location details: top (default, the `top` most frequent
+        # streets and cities with counts), all (every distinct name) or none
+        locations = request.args.get('locations', 'top')
+        top = int(request.args.get('top', 5))
+        if locations not in LOCATION_MODES or top < 1:
+            return jsonify({'error': 'Invalid locations or top parameter'}), 400
+
+        query = build_time_analysis_query(TIME_BUCKETS[time_type], where_clause, locations)
+        rows = yield Query(query, params + ([top, top] if locations == 'top' else []))
+
+        # The grand total row carries the traffic feature counts
+        traffic_stats = next(row for row in rows if row['is_total'])
+        results = [row for row in rows if not row['is_total']]
 
         # Process results
         data = {
@@ -136,8 +202,8 @@ def get_county_time_analysis():
         max_values = {'hour': 24, 'day': 7, 'month': 12}
         value_map = {row['time_value']: {
             'count': row['accident_count'],
-            'streets': row['streets'],
-            'cities': row['cities']
+            'streets': row['streets'] or [],
+            'cities': row['cities'] or []
         } for row in results}
 
         start_value = 1 if time_type == 'month' else 0
@@ -150,7 +216,6 @@ def get_county_time_analysis():
             })
 
         # Calculate percentages for traffic features
-        traffic_stats = execute_query(stats_query, params, fetch_all=False)
         total = traffic_stats['total_accidents'] or 1  # Avoid division by zero
         traffic_features = {
             'crossing': {
@@ -196,7 +261,9 @@ def get_county_time_analysis():
                     'months': months,
                     'days': days,
                     'feature': feature_filter
-                }
+                },
+                'locations': locations,
+                'top': top if locations == 'top' else None
             }
         })
 
@@ -1,80 +1,178 @@
-from flask import Blueprint, request, jsonify
-from api.utils.database import execute_query
+from flask import Blueprint, Response, after_this_request, request, jsonify
+from api.utils.database import stream_query
+from api.utils.handlers import Query, query_handler
+from api.utils.mercator import (
+    LATITUDE_FILTER, MAX_ZOOM, PIXEL_X_SQL, PIXEL_Y_SQL, TILE_SIZE, pixel_to_lnglat,
+    tile_bounds, world_size
+)
+from config.config import Config
+from api.utils.query_builders import FilterCompiler, QueryBuilder
+from api.utils.point_codec import MIME_TYPE as BINARY_MIME_TYPE, pack_points
+from api.utils.rollup import ROLLUP_TABLE, ROLLUP_COUNT, ROLLUP_AVG_SEVERITY, rollup_available
+from api.utils.sampling import SAMPLE_KEY_SQL, SAMPLE_MODES, estimate_rows, sample_threshold
+from api.utils.streaming import json_stream
+import math
 import traceback
 
 spatial_bp = Blueprint('spatial', __name__)
 
+BIN_MODES = ('hex', 'grid')
+
+# Tile cell sizes in pixels: divisors of the tile size, so no grid cell
+# straddles a tile edge and gets counted by two neighbouring tiles
+TILE_RESOLUTIONS = tuple(size for size in range(1, TILE_SIZE + 1) if TILE_SIZE % size == 0)
+
+# Default number of points in the national view
+MAP_POINT_LIMIT = 300000
+
+def build_bin_query(mode, where_clause):
+    """Aggregate accidents into screen-space cells.
+
+    Points are projected to Web Mercator pixels at the requested zoom and
+    grouped into squares (grid) or pointy-top hexagons (hex) whose side or
+    radius is the resolution in pixels. Cells are returned in order as
+    integer (col, row) coordinates; hexagons use axial coordinates.
+    Parameters are the world size twice, the filter params, then the cell
+    size twice.
+    """
+    projected = f"""
+        SELECT
+            {PIXEL_X_SQL} as px,
+            {PIXEL_Y_SQL} as py,
+            severity
+        FROM accidents
+        WHERE {where_clause}
+        AND {LATITUDE_FILTER}
+    """
+    if mode == 'grid':
+        return f"""
+            WITH projected AS ({projected})
+            SELECT
+                floor(px / %s)::bigint as col,
+                floor(py / %s)::bigint as row,
+                COUNT(*) as count,
+                AVG(severity)::numeric(10,2) as avg_severity
+            FROM projected
+            GROUP BY 1, 2
+            ORDER BY 1, 2
+        """
+    # Fractional axial coordinates rounded to the nearest hexagon through
+    # cube coordinates (q, r, -q-r), correcting the component that moved most
+    return f"""
+        WITH projected AS ({projected}),
+        axial AS (
+            SELECT
+                (sqrt(3.0) / 3.0 * px - py / 3.0) / %s as q,
+                (2.0 / 3.0 * py) / %s as r,
+                severity
+            FROM projected
+        ),
+        rounded AS (
+            SELECT
+                q, r, severity,
+                round(q) as rq,
+                round(r) as rr,
+                round(-q - r) as rs
+            FROM axial
+        )
+        SELECT
+            (CASE
+                WHEN abs(rq - q) > abs(rr - r) AND abs(rq - q) > abs(rs + q + r) THEN -rr - rs
+                ELSE rq
+            END)::bigint as col,
+            (CASE
+                WHEN abs(rq - q) > abs(rr - r) AND abs(rq - q) > abs(rs + q + r) THEN rr
+                WHEN abs(rr - r) > abs(rs + q + r) THEN -rq - rs
+                ELSE rr
+            END)::bigint as row,
+            COUNT(*) as count,
+            AVG(severity)::numeric(10,2) as avg_severity
+        FROM rounded
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    """
+
+def build_points_query(where_clause, sample_clause):
+    """National map points. sample_clause narrows them to the hash sample
+    (or orders them by severity); the last %s is the point limit.
+    """
+    return f"""
+        SELECT 
+            start_lat as lat,
+            start_lng as lng,
+            severity,
+            state,
+            weather_condition
+        FROM accidents 
+        WHERE {where_clause}
+        {sample_clause}
+        LIMIT %s
+    """
+
+def cell_center(mode, col, row, cell_size, zoom):
+    """(lng, lat) of the centre of a grid or hex cell"""
+    if mode == 'grid':
+        x, y = (col + 0.5) * cell_size, (row + 0.5) * cell_size
+    else:
+        x = cell_size * math.sqrt(3) * (col + row / 2)
+        y = cell_size * 1.5 * row
+    return pixel_to_lnglat(x, y, zoom)
+
 @spatial_bp.route('/api/spatial/map-data')
+@query_handler
 def get_map_data():
+    # Points come back binary or as JSON depending on Accept, so every
+    # response from this URL varies on it, JSON ones included
+    @after_this_request
+    def vary_on_accept(response):
+        response.vary.add('Accept')
+        return response
+
     try:
         # Get filter parameters as lists
         selected_state = request.args.get('state')
-        years = request.args.getlist('years[]')
-        months = request.args.getlist('months[]')
-        days = request.args.getlist('days[]')
-
-        # Convert years to integers to avoid type mismatch
-        if years:
-            years = [int(year) for year in years]
-        if months:
-            months = [int(month) for month in months]
-        if days:
-            days = [int(day) for day in days]
+        years = QueryBuilder.int_list(request.args, 'years[]')
+        months = QueryBuilder.int_list(request.args, 'months[]')
+        days = QueryBuilder.int_list(request.args, 'days[]')
 
         # Build base conditions
-        conditions = ["start_lat IS NOT NULL", "start_lng IS NOT NULL"]
-        params = []
-
-        if years:
-            conditions.append("year = ANY(%s)")
-            params.append(years)
-        if months:
-            conditions.append("month = ANY(%s)")
-            params.append(months)
-        if days:
-            conditions.append("day = ANY(%s)")
-            params.append(days)
+        filters = FilterCompiler()
+        filters.add("start_lat IS NOT NULL").add("start_lng IS NOT NULL")
+        filters.values('year', years).values('month', months).values('day', days)
 
         # Add state filter if selected
-        if selected_state:
-            conditions.append("state = %s")
-            params.append(selected_state)
+        filters.equals('state', selected_state)
 
-        where_clause = " AND ".join(conditions)
+        where_clause, params = filters.compile()
 
-        # Choose query based on view type
-        if selected_state:
-            # County-level aggregated data for state view
-            points_query = f"""
-                SELECT 
-                    county,
-                    COUNT(*) as total_accidents,
-                    AVG(severity)::numeric(10,2) as avg_severity,
-                    AVG(start_lat) as lat,
-                    AVG(start_lng) as lng,
-                    string_agg(DISTINCT weather_condition, ', ') as weather_conditions
-                FROM accidents 
-                WHERE {where_clause}
-                AND county IS NOT NULL
-                GROUP BY county
-                ORDER BY total_accidents DESC
-            """
-        else:
-            # National view query optimized for hexagon layer
-            points_query = f"""
-                SELECT 
-                    start_lat as lat,
-                    start_lng as lng,
-                    severity,
-                    state,
-                    weather_condition
-                FROM accidents 
-                WHERE {where_clause}
-                ORDER BY severity DESC
-                LIMIT 300000
-            """
-        
-        points = execute_query(points_query, params)
+        # Optional server-side binning instead of raw points
+        aggregate = request.args.get('aggregate')
+        if aggregate and aggregate not in BIN_MODES:
+            return jsonify({'error': f"aggregate must be one of {', '.join(BIN_MODES)}"}), 400
+        try:
+            zoom = int(request.args.get('zoom', 4))
+            resolution = float(request.args.get('resolution', 20))
+        except ValueError:
+            return jsonify({'error': 'Invalid zoom or resolution'}), 400
+        if not 0 <= zoom <= MAX_ZOOM or not math.isfinite(resolution) or resolution <= 0:
+            return jsonify({'error': 'Invalid zoom or resolution'}), 400
+
+        # Packed binary points when asked for with format=binary or an
+        # Accept header preferring it; only the national point view has them
+        binary = not aggregate and not selected_state and (
+            request.args.get('format') == 'binary' or
+            request.accept_mimetypes.best_match(['application/json', BINARY_MIME_TYPE])
+            == BINARY_MIME_TYPE
+        )
+
+        # National points are a reproducible hash sample of about
+        # sample_size rows, or with sample=severity the most severe ones
+        sample = request.args.get('sample', 'hash')
+        sample_size = int(request.args.get('sample_size', MAP_POINT_LIMIT))
+        if sample not in SAMPLE_MODES:
+            return jsonify({'error': f"sample must be one of {', '.join(SAMPLE_MODES)}"}), 400
+        if sample_size < 1:
+            return jsonify({'error': 'sample_size must be positive'}), 400
 
         # Get summary statistics
         summary_query = f"""
@@ -89,7 +187,6 @@ def get_map_data():
             FROM accidents 
             WHERE {where_clause}
         """
-        summary = execute_query(summary_query, params, fetch_all=False)
 
         # Get time distribution
         time_query = f"""
@@ -103,39 +200,165 @@ def get_map_data():
             GROUP BY year, month
             ORDER BY year, month
         """
-        time_distribution = execute_query(time_query, params)
 
-        # Process points for HexagonLayer compatibility
-        processed_points = []
-        for point in points:
-            processed_points.append({
-                'lat': float(point['lat']),
-                'lng': float(point['lng']),
-                'severity': float(point['severity']) if point.get('severity') else 1.0,
-                'state': point['state'],
-                'weather_condition': point.get('weather_condition')
+        summary_query = Query(summary_query, params, fetch_all=False)
+        time_query = Query(time_query, params)
+
+        # Hash-sampled points are sized from the planner's row estimate,
+        # which costs a plan rather than the summary's full scan
+        sample_params = []
+        if sample == 'severity':
+            sample_clause = "ORDER BY severity DESC"
+        else:
+            sample_clause = ""
+            if not aggregate and not selected_state:
+                estimate = yield from estimate_rows(where_clause, params)
+                threshold = sample_threshold(estimate, sample_size)
+                if threshold is not None:
+                    sample_clause = f"AND {SAMPLE_KEY_SQL} < %s"
+                    sample_params.append(threshold)
+        point_params = params + sample_params + [sample_size]
+
+        # Choose query based on view type
+        if aggregate:
+            world = world_size(zoom)
+            main_query = Query(build_bin_query(aggregate, where_clause),
+                               [world, world] + params + [resolution, resolution],
+                               tuples=True)
+        elif selected_state:
+            # County-level aggregated data for state view
+            main_query = Query(f"""
+                SELECT 
+                    county,
+                    COUNT(*) as total_accidents,
+                    AVG(severity)::numeric(10,2) as avg_severity,
+                    AVG(start_lat) as lat,
+                    AVG(start_lng) as lng,
+                    string_agg(DISTINCT weather_condition, ', ') as weather_conditions
+                FROM accidents 
+                WHERE {where_clause}
+                AND county IS NOT NULL
+                GROUP BY county
+                ORDER BY total_accidents DESC
+            """, params, tuples=True)
+        elif binary:
+            # Same points as below, fetched as one row of column arrays
+            main_query = Query(f"""
+                WITH points AS ({build_points_query(where_clause, sample_clause)})
+                SELECT
+                    COALESCE(array_agg(lat), '{{}}') as lat,
+                    COALESCE(array_agg(lng), '{{}}') as lng,
+                    COALESCE(array_agg(severity), '{{}}') as severity,
+                    COALESCE(array_agg(state), '{{}}') as state,
+                    COALESCE(array_agg(weather_condition), '{{}}') as weather_condition
+                FROM points
+            """, point_params, fetch_all=False)
+        else:
+            # National view query optimized for hexagon layer
+            main_query = Query(build_points_query(where_clause, sample_clause),
+                               point_params, tuples=True)
+
+        # The summary, time distribution and point or cell queries run side
+        # by side. Large national point sets are written out as they are
+        # read, so only the small queries are answered up front
+        streamed = (not aggregate and not selected_state and not binary
+                    and sample_size >= Config.STREAM_MIN_ROWS)
+        if streamed:
+            summary, time_distribution = yield [summary_query, time_query]
+            rows = stream_query(main_query.query, main_query.params, tuples=True)
+        else:
+            summary, time_distribution, rows = yield [summary_query, time_query, main_query]
+
+        summary_stats = {
+            'total_accidents': summary['total_accidents'],
+            'avg_severity': float(summary['avg_severity']) if summary['avg_severity'] else 0,
+            'states_affected': summary['states_affected'],
+            'common_weather': summary['common_weather'],
+            'years_count': summary['years_count'],
+            'months_count': summary['months_count'],
+            'days_count': summary['days_count']
+        }
+        query_params = {
+            'state': selected_state,
+            'years': years,
+            'months': months,
+            'days': days,
+            'sample': sample,
+            'sample_size': sample_size
+        }
+
+        if aggregate:
+            # One entry per cell, positioned at the cell centre
+            processed_cells = []
+            for cell in rows:
+                lng, lat = cell_center(aggregate, cell.col, cell.row, resolution, zoom)
+                processed_cells.append({
+                    'lat': lat,
+                    'lng': lng,
+                    'count': cell.count,
+                    'avg_severity': float(cell.avg_severity) if cell.avg_severity else None
+                })
+
+            return jsonify({
+                'cells': processed_cells,
+                'summary': summary_stats,
+                'timeDistribution': time_distribution,
+                'metadata': {
+                    'total_cells': len(processed_cells),
+                    'aggregation': {
+                        'mode': aggregate,
+                        'zoom': zoom,
+                        'resolution': resolution
+                    },
+                    'query_params': query_params
+                }
             })
 
+        if binary:
+            body = pack_points(
+                rows['lat'], rows['lng'], rows['severity'],
+                rows['state'], rows['weather_condition'],
+                {
+                    'summary': summary_stats,
+                    'timeDistribution': time_distribution,
+                    'metadata': {
+                        'total_points': len(rows['lat']),
+                        'query_params': query_params
+                    }
+                }
+            )
+            return Response(body, mimetype=BINARY_MIME_TYPE)
+
+        # Process points for HexagonLayer compatibility
+        points = ({
+            'lat': float(point.lat),
+            'lng': float(point.lng),
+            'severity': float(point.severity) if point.severity else 1.0,
+            'state': point.state,
+            'weather_condition': point.weather_condition
+        } for point in rows)
+
+        if streamed:
+            return json_stream(
+                {'summary': summary_stats, 'timeDistribution': time_distribution},
+                'points',
+                points,
+                lambda count: {
+                    'metadata': {
+                        'total_points': count,
+                        'query_params': query_params
+                    }
+                }
+            )
+
+        processed_points = list(points)
         return jsonify({
             'points': processed_points,
-            'summary': {
-                'total_accidents': summary['total_accidents'],
-                'avg_severity': float(summary['avg_severity']) if summary['avg_severity'] else 0,
-                'states_affected': summary['states_affected'],
-                'common_weather': summary['common_weather'],
-                'years_count': summary['years_count'],
-                'months_count': summary['months_count'],
-                'days_count': summary['days_count']
-            },
+            'summary': summary_stats,
             'timeDistribution': time_distribution,
             'metadata': {
                 'total_points': len(processed_points),
-                'query_params': {
-                    'state': selected_state,
-                    'years': years,
-                    'months': months,
-                    'days': days
-                }
+                'query_params': query_params
             }
         })
         
@@ -146,51 +369,111 @@ def get_map_data():
             'error': 'Internal server error'
         }), 500
         
+@spatial_bp.route('/api/spatial/tiles/<int:z>/<int:x>/<int:y>')
+@query_handler
+def get_tile(z, x, y):
+    """Accidents in one XYZ map tile, binned into a grid.
+
+    Cells are ``resolution`` pixels square (8 by default, so at most 32x32
+    per tile), a divisor of the tile size so cells never cross its edges and returned as parallel arrays. Takes the same state and
+    years[]/months[]/days[] filters as map-data. Responses carry an ETag
+    and a Cache-Control max-age so browsers and proxies can reuse tiles.
+    """
+    try:
+        if z > MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+            return jsonify({'error': 'Tile out of range'}), 400
+        try:
+            resolution = float(request.args.get('resolution', 8))
+        except ValueError:
+            return jsonify({'error': 'Invalid resolution'}), 400
+        if resolution not in TILE_RESOLUTIONS:
+            return jsonify({
+                'error': f"resolution must be one of {', '.join(map(str, TILE_RESOLUTIONS))}"
+            }), 400
+
+        # Restrict to the tile, edges shared with the east/south neighbours excluded
+        west, south, east, north = tile_bounds(z, x, y)
+        filters = FilterCompiler()
+        filters.add("start_lng >= %s", west).add("start_lng < %s", east)
+        filters.add("start_lat > %s", south).add("start_lat <= %s", north)
+
+        # Same filters as map-data
+        QueryBuilder.time_filters(request.args, filters)
+        filters.equals('state', request.args.get('state'))
+
+        where_clause, params = filters.compile()
+
+        world = world_size(z)
+        cells_query = build_bin_query('grid', where_clause)
+        cells = yield Query(cells_query, [world, world] + params + [resolution, resolution],
+                            tuples=True)
+
+        # Columnar layout: one array per attribute
+        tile = {'lng': [], 'lat': [], 'count': [], 'avg_severity': []}
+        for cell in cells:
+            lng, lat = cell_center('grid', cell.col, cell.row, resolution, z)
+            tile['lng'].append(round(lng, 6))
+            tile['lat'].append(round(lat, 6))
+            tile['count'].append(cell.count)
+            tile['avg_severity'].append(
+                float(cell.avg_severity) if cell.avg_severity is not None else None
+            )
+
+        response = jsonify({
+            'z': z,
+            'x': x,
+            'y': y,
+            'resolution': resolution,
+            'cells': tile
+        })
+        response.cache_control.public = True
+        response.cache_control.max_age = Config.TILE_MAX_AGE
+        response.add_etag()
+        return response.make_conditional(request)
+
+    except Exception as e:
+        print(f"Error in get_tile: {str(e)}")
+        print(f"Traceback: {traceback.format_exc()}")
+        return jsonify({
+            'error': 'Internal server error'
+        }), 500
+
 # Add this to spatial_routes.py
 @spatial_bp.route('/api/spatial/top-accidents')
+@query_handler
 def get_top_accidents():
     try:
         # Get filter parameters
         view_type = request.args.get('view_type', 'state')
         selected_state = request.args.get('state')
         selected_county = request.args.get('county')
-        years = request.args.getlist('years[]')
-        months = request.args.getlist('months[]')
-        days = request.args.getlist('days[]')
 
         # Build base conditions
-        conditions = ["1=1"]  # Always true condition as base
-        params = []
-
-        # Add time-based filters
-        if years:
-            years = [int(year) for year in years]
-            conditions.append("year = ANY(%s)")
-            params.append(years)
-        
-        if months:
-            months = [int(month) for month in months]
-            conditions.append("month = ANY(%s)")
-            params.append(months)
-        
-        if days:
-            days = [int(day) for day in days]
-            conditions.append("day = ANY(%s)")
-            params.append(days)
+        filters = QueryBuilder.time_filters(request.args)
 
         # Add hierarchy filters
-        if selected_state:
-            conditions.append("state = %s")
-            params.append(selected_state)
-        
-        if selected_county:
-            conditions.append("county = %s")
-            params.append(selected_county)
+        filters.equals('state', selected_state).equals('county', selected_county)
 
-        where_clause = " AND ".join(conditions)
+        where_clause, params = filters.compile()
 
         # Build query based on view type
-        if view_type == 'state':
+        if (yield from rollup_available()):
+            # Every filter and grouping column here is a rollup key
+            name_column = view_type if view_type in ('state', 'county') else 'city'
+            null_filter = "" if name_column == 'state' else f"AND {name_column} IS NOT NULL"
+            query = f"""
+                SELECT 
+                    {name_column} as name,
+                    {ROLLUP_COUNT} as accidents,
+                    ROUND({ROLLUP_AVG_SEVERITY}, 2) as avg_severity
+                FROM {ROLLUP_TABLE}
+                WHERE {where_clause}
+                {null_filter}
+                GROUP BY {name_column}
+                ORDER BY accidents DESC
+                LIMIT 10
+            """
+        elif view_type == 'state':
             query = f"""
                 SELECT 
                     state as name,
@@ -229,15 +512,15 @@ def get_top_accidents():
                 LIMIT 10
             """
 
-        results = execute_query(query, params)
+        results = yield Query(query, params, tuples=True)
         
         # Ensure numeric types are properly formatted
         formatted_results = []
         for row in results:
             formatted_row = {
-                'name': row['name'],
-                'accidents': int(row['accidents']),
-                'avg_severity': float(row['avg_severity']) if row['avg_severity'] is not None else None
+                'name': row.name,
+                'accidents': int(row.accidents),
+                'avg_severity': float(row.avg_severity) if row.avg_severity is not None else None
             }
             formatted_results.append(formatted_row)
 
@@ -253,6 +536,7 @@ def get_top_accidents():
         # Add to spatial_routes.py
 
 @spatial_bp.route('/api/spatial/states')
+@query_handler
 def get_states():
     try:
         query = """
@@ -261,9 +545,8 @@ def get_states():
             WHERE state IS NOT NULL 
             ORDER BY state
         """
-        results = execute_query(query)
-        states = [row['state'] for row in results]
-        print(f"Returning states: {states}")  # Add this log
+        results = yield Query(query, tuples=True)
+        states = [row.state for row in results]
         return jsonify(states)
     except Exception as e:
         print(f"Error in get_states: {str(e)}")
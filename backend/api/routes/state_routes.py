@@ -1,101 +1,53 @@
 
 # state_routes.py
 from flask import Blueprint, request, jsonify
-from api.utils.database import execute_query
+from api.utils.handlers import Query, query_handler
+from api.utils.query_builders import QueryBuilder
+from api.utils.geometry import SIMPLIFY_TOLERANCES, get_county_shapes
+from api.utils.rollup import ROLLUP_TABLE, ROLLUP_COUNT, ROLLUP_AVG_SEVERITY, rollup_available
 import traceback
 
 state_bp = Blueprint('state', __name__)
 
 @state_bp.route('/api/state/details')
+@query_handler
 def get_state_details():
     try:
         # Get filter parameters
         state = request.args.get('state')
-        years = request.args.getlist('years[]')
-        months = request.args.getlist('months[]')
-        days = request.args.getlist('days[]')
 
         if not state:
             return jsonify({'error': 'State parameter is required'}), 400
 
-        # Convert to integers
-        if years:
-            years = [int(year) for year in years]
-        if months:
-            months = [int(month) for month in months]
-        if days:
-            days = [int(day) for day in days]
+        # County outline detail: high, medium or low
+        detail = request.args.get('detail', 'medium')
+        if detail not in SIMPLIFY_TOLERANCES:
+            return jsonify({'error': f"detail must be one of {', '.join(SIMPLIFY_TOLERANCES)}"}), 400
+
+        # Per-county city lists: all (default), none, or the N with the
+        # most accidents
+        cities = request.args.get('cities', 'all')
+        if cities not in ('all', 'none') and not cities.isdigit():
+            return jsonify({'error': 'cities must be all, none or a number'}), 400
 
         # Build conditions
-        conditions = ["state = %s"]
-        params = [state]
-
-        if years:
-            conditions.append("year = ANY(%s)")
-            params.append(years)
-        if months:
-            conditions.append("month = ANY(%s)")
-            params.append(months)
-        if days:
-            conditions.append("day = ANY(%s)")
-            params.append(days)
-
-        where_clause = " AND ".join(conditions)
-
-        # Get county data with proper coordinates
-        county_query = f"""
-            WITH county_stats AS (
-                SELECT 
-                    county,
-                    COUNT(*) as accident_count,
-                    AVG(severity)::numeric(10,2) as avg_severity,
-                    array_agg(DISTINCT city) as cities,
-                    MODE() WITHIN GROUP (ORDER BY weather_condition) as common_weather,
-                    MIN(start_lat) as min_lat,
-                    MAX(start_lat) as max_lat,
-                    MIN(start_lng) as min_lng,
-                    MAX(start_lng) as max_lng
-                FROM accidents 
-                WHERE {where_clause}
-                AND county IS NOT NULL
-                GROUP BY county
-            )
-            SELECT 
-                county as name,
-                accident_count,
-                avg_severity,
-                cities,
-                common_weather,
-                min_lat,
-                max_lat,
-                min_lng,
-                max_lng,
-                ROUND(100.0 * accident_count / SUM(accident_count) OVER (), 2) as percentage_of_total
-            FROM county_stats
-            ORDER BY accident_count DESC
-        """
-
-        counties = execute_query(county_query, params)
-
-        # Get state summary
-        summary_query = f"""
-            SELECT 
-                COUNT(*) as total_accidents,
-                AVG(severity)::numeric(10,2) as avg_severity,
-                COUNT(DISTINCT county) as counties_affected,
-                MODE() WITHIN GROUP (ORDER BY weather_condition) as common_weather,
-                array_agg(DISTINCT weather_condition) as weather_conditions,
-                MIN(start_lat) as min_lat,
-                MAX(start_lat) as max_lat,
-                MIN(start_lng) as min_lng,
-                MAX(start_lng) as max_lng
-            FROM accidents 
-            WHERE {where_clause}
-        """
+        filters = QueryBuilder.time_filters(request.args)
+        filters.equals('state', state)
+
+        where_clause, params = filters.compile()
 
-        summary = execute_query(summary_query, params, fetch_all=False)
+        if (yield from rollup_available()):
+            query = _rollup_query(where_clause, cities)
+        else:
+            query = _accident_query(where_clause, cities)
 
-        # Process counties into GeoJSON format
+        # The grand total row (is_total = 1) sorts first, then the counties
+        rows = yield Query(query, params)
+        summary = rows[0]
+        counties = [row for row in rows[1:] if row['name'] is not None]
+
+        # Join county stats onto the preloaded county outlines
+        shapes = get_county_shapes()
         features = []
         for county in counties:
             feature = {
@@ -105,19 +57,11 @@ def get_state_details():
                     "accident_count": int(county['accident_count']),
                     "avg_severity": float(county['avg_severity']),
                     "cities": county['cities'],
+                    "city_count": county['city_count'],
                     "common_weather": county['common_weather'],
                     "percentage_of_total": float(county['percentage_of_total'])
                 },
-                "geometry": {
-                    "type": "Polygon",
-                    "coordinates": [[
-                        [float(county['min_lng']), float(county['min_lat'])],
-                        [float(county['min_lng']), float(county['max_lat'])],
-                        [float(county['max_lng']), float(county['max_lat'])],
-                        [float(county['max_lng']), float(county['min_lat'])],
-                        [float(county['min_lng']), float(county['min_lat'])]
-                    ]]
-                }
+                "geometry": shapes.lookup(state, county['name'], detail)
             }
             features.append(feature)
 
@@ -127,7 +71,7 @@ def get_state_details():
                 "features": features
             },
             'summary': {
-                'total_accidents': summary['total_accidents'],
+                'total_accidents': summary['accident_count'],
                 'avg_severity': float(summary['avg_severity']),
                 'counties_affected': summary['counties_affected'],
                 'common_weather': summary['common_weather'],
@@ -147,3 +91,173 @@ def get_state_details():
         return jsonify({
             'error': 'Internal server error'
         }), 500
+
+
+def _city_cte(source, count_sql, cities):
+    """county_cities CTE over ``source``: each county's city list and its
+    number of distinct cities.
+
+    The cities are grouped once per (county, city) and ranked by accident
+    count, so cities=N keeps the top N without building every county's full
+    list first. cities=all lists them all by name. The CTE stays outside
+    the GROUPING SETS, so no state-wide list is built for the total row.
+    """
+    if cities == 'none':
+        return ""
+    if cities == 'all':
+        city_list = "array_agg(city ORDER BY city)"
+    else:
+        city_list = f"array_agg(city ORDER BY rank) FILTER (WHERE rank <= {int(cities)})"
+    return f""",
+        county_cities AS (
+            SELECT
+                county,
+                COALESCE({city_list}, '{{}}') as cities,
+                COUNT(DISTINCT city) as city_count
+            FROM (
+                SELECT
+                    county,
+                    city,
+                    row_number() OVER (
+                        PARTITION BY county ORDER BY {count_sql} DESC, city
+                    ) as rank
+                FROM {source}
+                WHERE county IS NOT NULL AND city IS NOT NULL
+                GROUP BY county, city
+            ) ranked
+            GROUP BY county
+        )"""
+
+
+def _city_columns(cities):
+    """(select items, join) adding county_cities to the stats rows"""
+    if cities == 'none':
+        return "NULL::text[] as cities, NULL::int as city_count", ""
+    return ("county_cities.cities, county_cities.city_count",
+            "LEFT JOIN county_cities "
+            "ON stats.is_total = 0 AND county_cities.county = stats.county")
+
+
+def _accident_query(where_clause, cities):
+    """County rows and the state total in one scan of the raw accidents.
+
+    GROUPING SETS ((county), ()) yields a row per county plus a grand total
+    row. Rows with no county count towards the total only; percentages are
+    of the named counties' accidents, as before. The filtered rows are
+    shared with the city lists, so Postgres reads them once.
+    """
+    city_columns, city_join = _city_columns(cities)
+    return f"""
+        WITH filtered AS (
+            SELECT county, city, severity, weather_condition, start_lat, start_lng
+            FROM accidents 
+            WHERE {where_clause}
+        ),
+        stats AS (
+            SELECT 
+                GROUPING(county) as is_total,
+                county,
+                COUNT(*) as accident_count,
+                AVG(severity)::numeric(10,2) as avg_severity,
+                MODE() WITHIN GROUP (ORDER BY weather_condition) as common_weather,
+                COUNT(DISTINCT county) as counties_affected,
+                array_agg(DISTINCT weather_condition) as weather_conditions,
+                MIN(start_lat) as min_lat,
+                MAX(start_lat) as max_lat,
+                MIN(start_lng) as min_lng,
+                MAX(start_lng) as max_lng,
+                ROUND(100.0 * COUNT(*) / SUM(
+                    CASE WHEN GROUPING(county) = 0 AND county IS NOT NULL THEN COUNT(*) END
+                ) OVER (), 2) as percentage_of_total
+            FROM filtered
+            GROUP BY GROUPING SETS ((county), ())
+        ){_city_cte('filtered', 'COUNT(*)', cities)}
+        SELECT 
+            stats.is_total,
+            stats.county as name,
+            accident_count,
+            avg_severity,
+            {city_columns},
+            common_weather,
+            counties_affected,
+            weather_conditions,
+            min_lat,
+            max_lat,
+            min_lng,
+            max_lng,
+            percentage_of_total
+        FROM stats
+        {city_join}
+        ORDER BY stats.is_total DESC, accident_count DESC
+    """
+
+
+def _rollup_query(where_clause, cities):
+    """The same rows answered from the rollup cells.
+
+    MODE() over accidents becomes the weather with the largest summed
+    count; ties go to the first value in sort order, as MODE() does. The
+    matching cells are read once and shared by every CTE consumer.
+    """
+    city_columns, city_join = _city_columns(cities)
+    return f"""
+        WITH cells AS MATERIALIZED (
+            SELECT *
+            FROM {ROLLUP_TABLE}
+            WHERE {where_clause}
+        ),
+        common_weather AS (
+            SELECT DISTINCT ON (is_total, county)
+                is_total,
+                county,
+                weather_condition
+            FROM (
+                SELECT
+                    GROUPING(county) as is_total,
+                    county,
+                    weather_condition,
+                    SUM(accident_count) as weather_count
+                FROM cells
+                WHERE weather_condition IS NOT NULL
+                GROUP BY GROUPING SETS ((county, weather_condition), (weather_condition))
+            ) weather_counts
+            ORDER BY is_total, county, weather_count DESC, weather_condition
+        ),
+        stats AS (
+            SELECT 
+                GROUPING(county) as is_total,
+                county,
+                {ROLLUP_COUNT} as accident_count,
+                {ROLLUP_AVG_SEVERITY}::numeric(10,2) as avg_severity,
+                COUNT(DISTINCT county) as counties_affected,
+                array_agg(DISTINCT weather_condition) as weather_conditions,
+                MIN(min_lat) as min_lat,
+                MAX(max_lat) as max_lat,
+                MIN(min_lng) as min_lng,
+                MAX(max_lng) as max_lng
+            FROM cells
+            GROUP BY GROUPING SETS ((county), ())
+        ){_city_cte('cells', 'SUM(accident_count)', cities)}
+        SELECT 
+            stats.is_total,
+            stats.county as name,
+            accident_count,
+            avg_severity,
+            {city_columns},
+            common_weather.weather_condition as common_weather,
+            counties_affected,
+            weather_conditions,
+            min_lat,
+            max_lat,
+            min_lng,
+            max_lng,
+            ROUND(100.0 * accident_count / SUM(accident_count) FILTER (
+                WHERE stats.is_total = 0 AND stats.county IS NOT NULL
+            ) OVER (), 2) as percentage_of_total
+        FROM stats
+        LEFT JOIN common_weather
+            ON common_weather.is_total = stats.is_total
+            AND common_weather.county IS NOT DISTINCT FROM stats.county
+        {city_join}
+        ORDER BY stats.is_total DESC, accident_count DESC
+    """
@@ -0,0 +1,136 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+from config.config import Config
+
+# One JSON line per request on stdout. Requests only put records on a
+# queue; a listener thread does the formatting and writing, so a slow or
+# blocked stdout never holds up a response.
+logger = logging.getLogger('api.access')
+
+_queue = queue.SimpleQueue()
+_listener = None
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+class JSONFormatter(logging.Formatter):
+    """Render a record's ``access`` fields as a single JSON object"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname
+        }
+        entry.update(getattr(record, 'access', {'message': record.getMessage()}))
+        return json.dumps(entry, default=str)
+
+
+def setup_access_log():
+    """Attach the queue handler to the access logger at ACCESS_LOG_LEVEL"""
+    logger.setLevel(Config.ACCESS_LOG_LEVEL)
+    logger.propagate = False
+    if not logger.handlers:
+        logger.addHandler(QueueHandler(_queue))
+
+
+def _ensure_listener():
+    """Start this process's writer thread.
+
+    Like the pool and the query executor, a forked child (e.g. a gunicorn
+    worker) starts its own thread rather than relying on the parent's,
+    which doesn't exist in the child.
+    """
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            stream = logging.StreamHandler(sys.stdout)
+            stream.setFormatter(JSONFormatter())
+            _listener = QueueListener(_queue, stream)
+            _listener.start()
+            _listener_pid = os.getpid()
+            # Write out whatever is still queued when the process exits
+            atexit.register(_listener.stop)
+
+
+def request_stats():
+    """The current request's query and row counters, or None outside one"""
+    if not has_request_context():
+        return None
+    return g.get('access_stats')
+
+
+def record_rows(rows, queries=1, stats=None):
+    """Add to the request's counters. ``rows`` is a row count or a result
+    as execute_query returns it; stats defaults to the current request's.
+    """
+    stats = stats if stats is not None else request_stats()
+    if stats is None:
+        return
+    if not isinstance(rows, int):
+        rows = len(rows) if isinstance(rows, list) else int(rows is not None)
+    stats['queries'] += queries
+    stats['rows'] += rows
+
+
+def start_request():
+    """before_request hook: start the clock and the counters"""
+    g.access_stats = {'started': time.perf_counter(), 'queries': 0, 'rows': 0}
+
+
+def finish_request(response):
+    """after_request hook: log the request once its response is closed.
+
+    Logging on close lets streamed responses report the rows they wrote
+    and the full time taken to send them. Failed requests (4xx/5xx) are
+    always logged at their level; the rest are sampled at
+    ACCESS_LOG_SAMPLE_RATE.
+    """
+    stats = g.get('access_stats')
+    if stats is None:
+        return response
+    if response.status_code >= 500:
+        level = logging.ERROR
+    elif response.status_code >= 400:
+        level = logging.WARNING
+    else:
+        level = logging.INFO
+        if random.random() >= Config.ACCESS_LOG_SAMPLE_RATE:
+            return response
+    if not logger.isEnabledFor(level):
+        return response
+
+    entry = {
+        'method': request.method,
+        'path': request.path,
+        'route': request.url_rule.rule if request.url_rule else None,
+        'status': response.status_code,
+        'streamed': response.is_streamed
+    }
+    if level == logging.INFO:
+        entry['sample_rate'] = Config.ACCESS_LOG_SAMPLE_RATE
+
+    def log():
+        entry.update({
+            'duration_ms': round((time.perf_counter() - stats['started']) * 1000, 2),
+            'queries': stats['queries'],
+            'rows': stats['rows']
+        })
+        _ensure_listener()
+        logger.log(level, 'request', extra={'access': entry})
+
+    response.call_on_close(log)
+    return response
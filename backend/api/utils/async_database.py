@@ -0,0 +1,85 @@
+import psycopg
+from psycopg import AsyncClientCursor
+from psycopg.rows import dict_row, namedtuple_row
+from psycopg_pool import AsyncConnectionPool
+
+from api.utils import database
+from api.utils.cache import normalize_key
+from config.config import Config
+
+# Async counterpart of the psycopg2 pool in database.py, used by the ASGI
+# app (asgi.py). Queries use client-side parameter binding, so the same
+# %s SQL and params adapt exactly as they do under psycopg2, and rows come
+# back as dicts like RealDictCursor's.
+_pool = None
+
+
+async def open_pool():
+    """Create and open the async pool; called at ASGI startup"""
+    global _pool
+    if _pool is None:
+        _pool = AsyncConnectionPool(
+            psycopg.conninfo.make_conninfo(**Config.DATABASE_CONFIG),
+            min_size=Config.ASYNC_DB_POOL_MIN,
+            max_size=Config.ASYNC_DB_POOL_MAX,
+            timeout=Config.DB_POOL_TIMEOUT,
+            check=AsyncConnectionPool.check_connection,
+            kwargs={'cursor_factory': AsyncClientCursor, 'row_factory': dict_row},
+            open=False
+        )
+        await _pool.open()
+    return _pool
+
+
+async def close_pool():
+    """Close the async pool; called at ASGI shutdown"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def get_async_pool_stats():
+    """Expose the async pool's size and wait counters, or None when the
+    pool isn't open (the app is not being served by asgi.py)"""
+    return _pool.get_stats() if _pool is not None else None
+
+
+async def _run_query(query, params, fetch_all, tuples=False):
+    async with _pool.connection() as conn:
+        async with conn.cursor(row_factory=namedtuple_row if tuples else dict_row) as cur:
+            await cur.execute(query, params or ())  # noqa: S608
+            if fetch_all:
+                return await cur.fetchall()
+            return await cur.fetchone()
+
+
+async def _check_data_version():
+    """Async form of database._check_data_version"""
+    if not database._claim_version_check():
+        return
+    try:
+        row = await _run_query(database.DATA_VERSION_QUERY, None, False)
+        version = row['version'] if row else 0
+    except psycopg.errors.UndefinedTable:
+        version = 0
+    database._apply_data_version(version)
+
+
+async def fetch_query(query, params=None, fetch_all=True, use_cache=True, tuples=False):
+    """execute_query on the async pool.
+
+    Shares the process's query cache and data version with execute_query,
+    so both drivers see the same cached results.
+    """
+    if not (use_cache and Config.QUERY_CACHE_ENABLED):
+        return await _run_query(query, params, fetch_all, tuples)
+
+    await _check_data_version()
+    key = normalize_key(query, params) + (fetch_all, tuples)
+    hit, result = database.query_cache.get(key)
+    if hit:
+        return result
+    result = await _run_query(query, params, fetch_all, tuples)
+    database.query_cache.set(key, result)
+    return result
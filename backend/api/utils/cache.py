@@ -0,0 +1,112 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_key(query, params):
+    """Cache key for a (SQL, params) pair.
+
+    Whitespace in the SQL is collapsed so the same statement built with
+    different indentation maps to one entry, and list params become tuples
+    so the key is hashable.
+    """
+    sql_key = " ".join(query.split())
+    if params is None:
+        return sql_key, ()
+    return sql_key, tuple(tuple(p) if isinstance(p, list) else p for p in params)
+
+
+def estimate_size(result):
+    """Rough in-memory size of a query result in bytes"""
+    if result is None:
+        return 0
+    rows = result if isinstance(result, list) else [result]
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        values = row.values() if isinstance(row, dict) else row
+        for value in values:
+            size += sys.getsizeof(value)
+            if isinstance(value, list):
+                # Array columns, e.g. from array_agg
+                size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class QueryCache:
+    """Thread-safe LRU of query results bounded by total size in bytes.
+
+    Entries expire ``ttl`` seconds after they are stored. Cached results are
+    shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (result, size, expires_at)
+        self._bytes = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+    def get(self, key):
+        """Return (True, result) on a hit, (False, None) otherwise"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None
+            result, size, expires_at = entry
+            if time.monotonic() >= expires_at:
+                self._remove(key)
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return True, result
+
+    def set(self, key, result):
+        size = estimate_size(result)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (result, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def _remove(self, key):
+        # Called with the lock held
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """Drop every entry, e.g. after new rows were imported"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats.update({
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hit_rate': stats['hits'] / lookups if lookups else 0.0
+            })
+            return stats
@@ -1,21 +1,403 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
 import psycopg2
 from psycopg2 import sql
-from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg2.extras import NamedTupleCursor, RealDictCursor
+from api.utils.cache import QueryCache, normalize_key
 from config.config import Config
 
+# Single-row table the importer bumps whenever it loads new rows
+DATA_VERSION_TABLE = 'accidents_data_version'
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within the pool timeout"""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are opened lazily up to ``maxconn``. When all of them are
+    checked out, callers wait up to ``timeout`` seconds before PoolTimeout
+    is raised. Idle connections older than ``healthcheck_interval`` seconds
+    are pinged before being handed out and replaced if the ping fails.
+
+    The pool remembers the pid that created its connections; a forked child
+    (e.g. a gunicorn worker) starts with an empty pool instead of sharing
+    the parent's sockets.
+    """
+
+    def __init__(self, maxconn, timeout, healthcheck_interval, **connect_kwargs):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self._connect_kwargs = connect_kwargs
+        self._cond = threading.Condition()
+        self._idle = []  # list of (connection, last_used) pairs, most recent last
+        self._size = 0  # open connections, idle + checked out
+        self._pid = os.getpid()
+        # Connections inherited over fork. They are kept referenced, never
+        # closed: closing would terminate the parent's server session.
+        self._inherited = []
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._stats = {
+            'checkouts': 0,
+            'timeouts': 0,
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'healthcheck_failures': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0
+        }
+
+    def _check_pid(self):
+        # Called with the lock held
+        if self._pid == os.getpid():
+            return
+        self._inherited.extend(conn for conn, _ in self._idle)
+        self._idle = []
+        self._size = 0
+        self._pid = os.getpid()
+        self._reset_stats()
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.healthcheck_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            with self._cond:
+                self._stats['healthcheck_failures'] += 1
+            return False
+
+    def _discard(self, conn):
+        # Called with the lock held
+        self._stats['connections_discarded'] += 1
+        self._size -= 1
+        self._cond.notify()
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def getconn(self):
+        """Check a connection out of the pool, waiting up to the pool timeout"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                self._check_pid()
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    # Reserve the slot before connecting so concurrent
+                    # callers can't overshoot maxconn
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = psycopg2.connect(**self._connect_kwargs)
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['connections_created'] += 1
+                return self._checked_out(conn, started)
+
+            # Ping outside the lock so a slow server doesn't stall other callers
+            if self._is_healthy(conn, last_used):
+                return self._checked_out(conn, started)
+            with self._cond:
+                self._discard(conn)
+
+    def _checked_out(self, conn, started):
+        waited = time.monotonic() - started
+        with self._cond:
+            self._stats['checkouts'] += 1
+            self._stats['wait_time_total'] += waited
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], waited)
+        return conn
+
+    def putconn(self, conn):
+        """Return a connection to the pool, dropping it if it is unusable"""
+        if not conn.closed and conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        with self._cond:
+            if self._pid != os.getpid():
+                # Checked out before a fork; belongs to the parent
+                self._inherited.append(conn)
+                return
+            if conn.closed or conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def closeall(self):
+        """Close every idle connection owned by this process"""
+        with self._cond:
+            self._check_pid()
+            idle, self._idle = self._idle, []
+            for conn, _ in idle:
+                self._discard(conn)
+
+    def stats(self):
+        """Snapshot of pool size, checkout counts and wait times"""
+        with self._cond:
+            self._check_pid()
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.maxconn,
+                'wait_time_avg': (stats['wait_time_total'] / stats['checkouts']
+                                  if stats['checkouts'] else 0.0)
+            })
+            return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    Config.DB_POOL_MAX,
+                    Config.DB_POOL_TIMEOUT,
+                    Config.DB_POOL_HEALTHCHECK_INTERVAL,
+                    **Config.DATABASE_CONFIG
+                )
+    return _pool
+
+
+def get_pool_stats():
+    """Expose pool wait time and checkout counters"""
+    return get_pool().stats()
+
+
+@contextmanager
 def get_db_connection():
-    """Create a database connection"""
-    return psycopg2.connect(**Config.DATABASE_CONFIG)
+    """Borrow a pooled database connection for the duration of the block"""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def _cursor_factory(tuples):
+    return NamedTupleCursor if tuples else RealDictCursor
+
+
+def _run_query(query, params, fetch_all, tuples=False):
+    with get_db_connection() as conn:
+        with conn:
+            with conn.cursor(cursor_factory=_cursor_factory(tuples)) as cur:
+                cur.execute(query, params or ())  # noqa: S608
+                if fetch_all:
+                    return cur.fetchall()
+                return cur.fetchone()
+
+
+query_cache = QueryCache(Config.QUERY_CACHE_MAX_BYTES, Config.QUERY_CACHE_TTL)
+_data_version = None
+_version_checked_at = 0.0
+_version_lock = threading.Lock()
+
 
-def execute_query(query, params=None, fetch_all=True):
+DATA_VERSION_QUERY = f"SELECT version FROM {DATA_VERSION_TABLE} WHERE id = 1"
+
+
+def _claim_version_check():
+    """True when the data version is due to be read again, for one caller.
+
+    The version row is read at most every QUERY_CACHE_VERSION_CHECK_INTERVAL
+    seconds, so a finished import is picked up without a restart.
+    """
+    global _version_checked_at
+    if time.monotonic() - _version_checked_at < Config.QUERY_CACHE_VERSION_CHECK_INTERVAL:
+        return False
+    with _version_lock:
+        now = time.monotonic()
+        if now - _version_checked_at < Config.QUERY_CACHE_VERSION_CHECK_INTERVAL:
+            return False
+        _version_checked_at = now
+        return True
+
+
+def _apply_data_version(version):
+    """Clear the query cache if the importer bumped the version since last read"""
+    global _data_version
+    with _version_lock:
+        if _data_version is not None and version != _data_version:
+            query_cache.clear()
+        _data_version = version
+
+
+def _check_data_version():
+    """Clear the query cache once the importer has bumped the data version"""
+    if not _claim_version_check():
+        return
+    try:
+        row = _run_query(DATA_VERSION_QUERY, None, False)
+        version = row['version'] if row else 0
+    except psycopg2.errors.UndefinedTable:
+        # Nothing has been imported since the version table was introduced
+        version = 0
+    _apply_data_version(version)
+
+
+def get_cache_stats():
+    """Expose query cache hit/miss/eviction counters"""
+    return query_cache.stats()
+
+
+def execute_query(query, params=None, fetch_all=True, use_cache=True, tuples=False):
     """Execute a parameterized query and return results.
 
     All user-supplied values MUST be passed via the params tuple,
     never interpolated into the query string.
+
+    Rows are dicts, or with tuples=True namedtuples whose fields are read
+    by attribute or index. Those cost a fraction of a dict per row, for
+    callers that reshape the rows anyway; they serialize as JSON arrays,
+    so don't jsonify them as they are.
+
+    Results are cached on the normalized (SQL, params) pair until they
+    expire or the importer loads new rows. Cached results are shared, so
+    callers must not mutate them.
+    """
+    if not (use_cache and Config.QUERY_CACHE_ENABLED):
+        return _run_query(query, params, fetch_all, tuples)
+
+    _check_data_version()
+    key = normalize_key(query, params) + (fetch_all, tuples)
+    hit, result = query_cache.get(key)
+    if hit:
+        return result
+    result = _run_query(query, params, fetch_all, tuples)
+    query_cache.set(key, result)
+    return result
+
+
+def stream_query(query, params=None, tuples=False):
+    """Yield the rows of a parameterized query as they are read.
+
+    Unlike execute_query nothing is materialized: a server-side (named)
+    cursor fetches STREAM_ITERSIZE rows per round trip, so memory stays
+    flat however many rows match. The query runs on first iteration and
+    the pooled connection is held until the generator is exhausted or
+    closed. Results bypass the query cache. tuples is as for execute_query.
     """
     with get_db_connection() as conn:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query, params or ())  # noqa: S608
-            if fetch_all:
-                return cur.fetchall()
-            return cur.fetchone()
\ No newline at end of file
+        with conn:
+            # Plan for reading every row, not for the first few as cursors do
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL cursor_tuple_fraction = 1")
+            with conn.cursor('stream_query', cursor_factory=_cursor_factory(tuples)) as cur:
+                cur.itersize = Config.STREAM_ITERSIZE
+                cur.execute(query, params or ())  # noqa: S608
+                yield from cur
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process-wide worker threads for QueryBatch, or None when disabled.
+
+    Like the pool, a forked child starts its own threads rather than using
+    the parent's, which don't exist in the child.
+    """
+    global _executor, _executor_pid
+    if Config.DB_PARALLEL_WORKERS <= 0:
+        return None
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(Config.DB_PARALLEL_WORKERS,
+                                               thread_name_prefix='query')
+                _executor_pid = os.getpid()
+    return _executor
+
+
+class QueryBatch:
+    """Runs the independent queries of one request concurrently.
+
+    Each submitted query runs through execute_query on a worker thread
+    and its own pooled connection, so the request waits for its slowest
+    query instead of the sum of them. submit() returns a Future; call
+    result() on it where the rows are needed. Leaving the ``with`` block
+    waits for everything submitted, after cancelling whatever hasn't
+    started yet if the block raised.
+
+    The request thread holds no connection while it waits, so a batch
+    can't deadlock the pool; when every connection is busy the queries
+    queue for one like any other.
+    """
+
+    def __init__(self):
+        self._futures = []
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) alongside the other queries"""
+        executor = get_executor()
+        if executor is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = executor.submit(fn, *args, **kwargs)
+        self._futures.append(future)
+        return future
+
+    def submit(self, query, params=None, fetch_all=True, use_cache=True, tuples=False):
+        """execute_query(...) alongside the other queries"""
+        return self.call(execute_query, query, params, fetch_all, use_cache, tuples)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            for future in self._futures:
+                future.cancel()
+        wait(self._futures)
+        return False
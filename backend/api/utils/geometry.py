@@ -0,0 +1,152 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+
+# Census cartographic county boundaries shipped with the API
+COUNTIES_GEOJSON = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'routes', 'counties.geojson'
+)
+
+# Douglas-Peucker tolerance in degrees for each detail level
+SIMPLIFY_TOLERANCES = {
+    'high': 0.0,
+    'medium': 0.005,
+    'low': 0.02
+}
+
+# Decimal places kept in served coordinates (about a metre)
+COORDINATE_PRECISION = 5
+
+# Census STATEFP codes to the postal codes used in the accidents table
+STATE_FIPS = {
+    '01': 'AL', '02': 'AK', '04': 'AZ', '05': 'AR', '06': 'CA', '08': 'CO', '09': 'CT',
+    '10': 'DE', '11': 'DC', '12': 'FL', '13': 'GA', '15': 'HI', '16': 'ID', '17': 'IL',
+    '18': 'IN', '19': 'IA', '20': 'KS', '21': 'KY', '22': 'LA', '23': 'ME', '24': 'MD',
+    '25': 'MA', '26': 'MI', '27': 'MN', '28': 'MS', '29': 'MO', '30': 'MT', '31': 'NE',
+    '32': 'NV', '33': 'NH', '34': 'NJ', '35': 'NM', '36': 'NY', '37': 'NC', '38': 'ND',
+    '39': 'OH', '40': 'OK', '41': 'OR', '42': 'PA', '44': 'RI', '45': 'SC', '46': 'SD',
+    '47': 'TN', '48': 'TX', '49': 'UT', '50': 'VT', '51': 'VA', '53': 'WA', '54': 'WV',
+    '55': 'WI', '56': 'WY', '72': 'PR'
+}
+
+# LSAD code of independent cities (Baltimore, St. Louis, most of Virginia's)
+CITY_LSAD = '25'
+
+
+def normalize_county_name(name):
+    """Lookup key tolerant of the spelling differences between the accident
+    data and the Census names: case, accents, punctuation, a trailing
+    "County"/"Parish" and "Saint" vs "St."
+    """
+    key = unicodedata.normalize('NFKD', name).encode('ascii', 'ignore').decode().lower()
+    key = re.sub(r'\s+(county|parish)$', '', key.strip())
+    key = re.sub(r'^saint\b', 'st', key)
+    return re.sub(r'[^a-z0-9]', '', key)
+
+
+def simplify_ring(ring, tolerance):
+    """Douglas-Peucker simplification of a closed ring.
+
+    Rings that would collapse below a triangle are returned unchanged.
+    """
+    if tolerance <= 0 or len(ring) <= 4:
+        return ring
+    keep = [False] * len(ring)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(ring) - 1)]
+    while stack:
+        start, end = stack.pop()
+        (x1, y1), (x2, y2) = ring[start], ring[end]
+        dx, dy = x2 - x1, y2 - y1
+        length = (dx * dx + dy * dy) ** 0.5
+        farthest, max_distance = None, tolerance
+        for i in range(start + 1, end):
+            x, y = ring[i]
+            if length:
+                distance = abs(dy * (x - x1) - dx * (y - y1)) / length
+            else:
+                distance = ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+            if distance > max_distance:
+                farthest, max_distance = i, distance
+        if farthest is not None:
+            keep[farthest] = True
+            stack.append((start, farthest))
+            stack.append((farthest, end))
+    simplified = [point for point, kept in zip(ring, keep) if kept]
+    return simplified if len(simplified) >= 4 else ring
+
+
+def simplify_geometry(geometry, tolerance):
+    """Polygon or MultiPolygon simplified ring by ring, coordinates rounded"""
+    def polygon(rings):
+        return [
+            [[round(x, COORDINATE_PRECISION), round(y, COORDINATE_PRECISION)]
+             for x, y in simplify_ring(ring, tolerance)]
+            for ring in rings
+        ]
+
+    if geometry['type'] == 'Polygon':
+        coordinates = polygon(geometry['coordinates'])
+    else:
+        coordinates = [polygon(rings) for rings in geometry['coordinates']]
+    return {'type': geometry['type'], 'coordinates': coordinates}
+
+
+class CountyShapeIndex:
+    """County outlines by state and normalized county name.
+
+    Every county is simplified once per level in SIMPLIFY_TOLERANCES when
+    the index is built, so lookups only hand out prepared geometries.
+    Independent cities are also registered as "<name> city", and under the
+    bare name when no county of that name exists in the state.
+    """
+
+    def __init__(self, path=COUNTIES_GEOJSON):
+        with open(path) as f:
+            features = json.load(f)['features']
+
+        # Counties first so they keep the bare name over same-named cities
+        features.sort(key=lambda feature: feature['properties']['LSAD'] == CITY_LSAD)
+
+        self._shapes = {}
+        for feature in features:
+            properties = feature['properties']
+            state = STATE_FIPS.get(properties['STATEFP'])
+            if state is None or feature['geometry'] is None:
+                continue
+            shapes = {
+                level: simplify_geometry(feature['geometry'], tolerance)
+                for level, tolerance in SIMPLIFY_TOLERANCES.items()
+            }
+            counties = self._shapes.setdefault(state, {})
+            key = normalize_county_name(properties['NAME'])
+            if properties['LSAD'] == CITY_LSAD:
+                counties.setdefault(key + 'city', shapes)
+            counties.setdefault(key, shapes)
+
+    def lookup(self, state, county, level='medium'):
+        """Geometry of a county at the given detail level, or None"""
+        shapes = self._shapes.get(state, {}).get(normalize_county_name(county))
+        return shapes[level] if shapes else None
+
+    def stats(self):
+        return {
+            'states': len(self._shapes),
+            'counties': sum(len(counties) for counties in self._shapes.values())
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_county_shapes():
+    """Process-wide county index, built on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CountyShapeIndex()
+    return _index
@@ -0,0 +1,79 @@
+import asyncio
+from collections import namedtuple
+from functools import wraps
+
+from api.utils.access_log import record_rows
+from api.utils.database import QueryBatch, execute_query
+
+# A query a handler needs answered, with execute_query's arguments; see
+# query_handler
+Query = namedtuple('Query', ['query', 'params', 'fetch_all', 'use_cache', 'tuples'],
+                   defaults=(None, True, True, False))
+
+
+def query_handler(handler):
+    """Turn a route written as a generator into a Flask view.
+
+    The route yields a Query, or a list of Queries to run concurrently,
+    and receives the rows (or a list of results) back, in place of calling
+    execute_query. Its return value is whatever a Flask view returns.
+    Written this way, the same route runs on the Flask app through
+    run_sync and on the ASGI app (asgi.py) through run_async without
+    blocking the event loop on the database. A failed query is raised
+    inside the route at its yield.
+    """
+    @wraps(handler)
+    def view(**kwargs):
+        return run_sync(handler(**kwargs))
+
+    view.handler = handler
+    return view
+
+
+def _record(step, value):
+    # Count a step's queries and rows towards the request's access log entry
+    for result in (value if isinstance(step, list) else [value]):
+        record_rows(result)
+
+
+def run_sync(steps):
+    """Drive a handler generator with execute_query and QueryBatch"""
+    value, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value, error = None, None
+        try:
+            if isinstance(step, list):
+                with QueryBatch() as queries:
+                    futures = [queries.submit(*query) for query in step]
+                value = [future.result() for future in futures]
+            else:
+                value = execute_query(*step)
+            _record(step, value)
+        except Exception as e:
+            error = e
+
+
+async def run_async(steps):
+    """Drive a handler generator with the async pool, on the event loop"""
+    # Imported here so the Flask app runs without the async driver installed
+    from api.utils.async_database import fetch_query
+
+    value, error = None, None
+    while True:
+        try:
+            step = steps.throw(error) if error is not None else steps.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value, error = None, None
+        try:
+            if isinstance(step, list):
+                value = list(await asyncio.gather(*(fetch_query(*query) for query in step)))
+            else:
+                value = await fetch_query(*step)
+            _record(step, value)
+        except Exception as e:
+            error = e
@@ -0,0 +1,38 @@
+import math
+
+# Web Mercator, as used by the map: the world is a square of
+# TILE_SIZE * 2**zoom pixels with y growing southwards
+TILE_SIZE = 256
+MAX_LATITUDE = 85.0511287798
+MAX_ZOOM = 22
+
+# SQL expressions projecting start_lng/start_lat to world pixels; each takes
+# the world size in pixels as a %s parameter
+PIXEL_X_SQL = "((start_lng + 180.0) / 360.0 * %s)"
+PIXEL_Y_SQL = (
+    "((1.0 - ln(tan(radians(start_lat)) + 1.0 / cos(radians(start_lat))) / pi()) "
+    "/ 2.0 * %s)"
+)
+
+# Rows outside this band have no Mercator position
+LATITUDE_FILTER = f"start_lat BETWEEN {-MAX_LATITUDE} AND {MAX_LATITUDE}"
+
+
+def world_size(zoom):
+    """Width and height of the world in pixels at the given zoom"""
+    return TILE_SIZE * 2 ** zoom
+
+
+def pixel_to_lnglat(x, y, zoom):
+    """Inverse of the projection for a world pixel position"""
+    size = world_size(zoom)
+    lng = x / size * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1.0 - 2.0 * y / size))))
+    return lng, lat
+
+
+def tile_bounds(zoom, x, y):
+    """(west, south, east, north) in degrees of an XYZ tile"""
+    west, north = pixel_to_lnglat(x * TILE_SIZE, y * TILE_SIZE, zoom)
+    east, south = pixel_to_lnglat((x + 1) * TILE_SIZE, (y + 1) * TILE_SIZE, zoom)
+    return west, south, east, north
@@ -0,0 +1,23 @@
+import base64
+import json
+from datetime import datetime
+
+
+class InvalidCursor(ValueError):
+    """Raised when a continuation token cannot be decoded"""
+
+
+def encode_cursor(start_time, accident_id):
+    """Opaque continuation token for the keyset position (start_time, id)"""
+    payload = json.dumps([start_time.isoformat(), accident_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Return the (start_time, id) pair encoded by encode_cursor"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        start_time, accident_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(start_time), str(accident_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(token) from e
@@ -0,0 +1,66 @@
+import json
+import struct
+
+import numpy as np
+
+# Packed point payload, all integers little-endian:
+#
+#   magic    4 bytes  b'CLPT'
+#   version  uint32
+#   count    uint32   number of points (n)
+#   meta_len uint32   length of the JSON metadata block
+#   meta     meta_len bytes of UTF-8 JSON, space-padded to a multiple of 4
+#   lat      float32[n]
+#   lng      float32[n]
+#   state    uint16[n]  index into meta['dictionaries']['state']
+#   weather  uint16[n]  index into meta['dictionaries']['weather_condition']
+#   severity uint8[n]
+#
+# Every array starts on a boundary of its item size, so a browser can wrap
+# each one in a typed array view without copying. NULL_CODE marks a missing
+# state or weather condition.
+MIME_TYPE = 'application/octet-stream'
+MAGIC = b'CLPT'
+VERSION = 1
+NULL_CODE = 0xFFFF
+HEADER = struct.Struct('<4sIII')
+
+
+def dictionary_encode(values):
+    """Return (codes, dictionary) with codes indexing the distinct values"""
+    index = {}
+    codes = np.fromiter(
+        (NULL_CODE if value is None else index.setdefault(value, len(index))
+         for value in values),
+        dtype='<u2',
+        count=len(values)
+    )
+    if len(index) >= NULL_CODE:
+        raise ValueError("too many distinct values for uint16 codes")
+    return codes, list(index)
+
+
+def pack_points(lat, lng, severity, state, weather_condition, meta):
+    """Pack parallel point columns and a JSON-serializable meta dict"""
+    count = len(lat)
+    state_codes, states = dictionary_encode(state)
+    weather_codes, weather_conditions = dictionary_encode(weather_condition)
+    meta = dict(meta, dictionaries={
+        'state': states,
+        'weather_condition': weather_conditions
+    })
+    meta_bytes = json.dumps(meta, default=str).encode()
+    meta_bytes += b' ' * (-len(meta_bytes) % 4)
+
+    # Missing severities default to 1, as in the JSON response
+    severities = np.fromiter((s or 1 for s in severity), dtype='u1', count=count)
+
+    return b''.join([
+        HEADER.pack(MAGIC, VERSION, count, len(meta_bytes)),
+        meta_bytes,
+        np.asarray(lat, dtype='<f4').tobytes(),
+        np.asarray(lng, dtype='<f4').tobytes(),
+        state_codes.tobytes(),
+        weather_codes.tobytes(),
+        severities.tobytes()
+    ])
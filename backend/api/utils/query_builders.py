@@ -1,36 +1,115 @@
+# Full value range of the bounded columns. A selection covering all of it
+# only excludes NULLs, so it compiles to IS NOT NULL.
+COLUMN_DOMAINS = {
+    'month': (1, 12),
+    'day': (1, 31),
+    'hour': (0, 23),
+    'dow': (0, 6)
+}
+
+# Request list parameters for the time columns
+TIME_FILTERS = (
+    ('year', 'years[]'),
+    ('month', 'months[]'),
+    ('day', 'days[]')
+)
+
+
+class InvalidFilter(ValueError):
+    """Raised when a filter value lies outside its column's domain"""
+
+
+class FilterCompiler:
+    """Collects WHERE conditions and compiles them to canonical SQL.
+
+    A list of integers becomes a single comparison, a BETWEEN for a run of
+    consecutive values, or ANY() over the sorted distinct values; a list
+    spanning the column's whole domain becomes IS NOT NULL, which keeps
+    excluding rows with no value as ANY() did. Conditions are emitted
+    in sorted order, so equivalent requests compile to identical SQL and
+    params and share both a query plan and a query cache entry.
+    """
+
+    def __init__(self):
+        self._conditions = []  # list of (sql, params) pairs
+
+    def add(self, sql, *params):
+        """Add a raw condition with its %s parameters"""
+        self._conditions.append((sql, params))
+        return self
+
+    def equals(self, column, value):
+        """column = value, skipped when no value was given"""
+        if value is not None and value != '':
+            self.add(f"{column} = %s", value)
+        return self
+
+    def values(self, column, values):
+        """column IN values, in its cheapest equivalent form"""
+        values = sorted(set(values))
+        if not values:
+            return self
+        low, high = values[0], values[-1]
+        contiguous = high - low + 1 == len(values)
+        domain = COLUMN_DOMAINS.get(column)
+        if contiguous and domain and low <= domain[0] and high >= domain[1]:
+            return self.add(f"{column} IS NOT NULL")
+        if len(values) == 1:
+            return self.add(f"{column} = %s", low)
+        if contiguous:
+            return self.add(f"{column} BETWEEN %s AND %s", low, high)
+        return self.add(f"{column} = ANY(%s)", values)
+
+    def between(self, column, low, high):
+        """low <= column <= high.
+
+        Bounds on a column in COLUMN_DOMAINS must lie inside its domain, or
+        InvalidFilter is raised; other columns get a plain BETWEEN.
+        """
+        domain = COLUMN_DOMAINS.get(column)
+        if domain and not domain[0] <= min(low, high) <= max(low, high) <= domain[1]:
+            raise InvalidFilter(f"{column} must be between {domain[0]} and {domain[1]}")
+        if domain is None or low > high:
+            return self.add(f"{column} BETWEEN %s AND %s", low, high)
+        return self.values(column, range(low, high + 1))
+
+    def compile(self):
+        """Return (where_clause, params)"""
+        conditions = sorted(self._conditions, key=lambda c: (c[0], repr(c[1])))
+        where_clause = " AND ".join(sql for sql, _ in conditions) or "1=1"
+        params = [param for _, condition_params in conditions for param in condition_params]
+        return where_clause, params
+
+
 class QueryBuilder:
+    @staticmethod
+    def int_list(args, name):
+        """Integers of a repeated request parameter such as years[]"""
+        return [int(value) for value in args.getlist(name)]
+
+    @staticmethod
+    def time_filters(args, filters=None, skip=()):
+        """Add the years[]/months[]/days[] selections to a FilterCompiler.
+
+        Columns named in skip are left out, e.g. month when the months are
+        the buckets being analysed.
+        """
+        filters = filters if filters is not None else FilterCompiler()
+        for column, name in TIME_FILTERS:
+            if column not in skip:
+                filters.values(column, QueryBuilder.int_list(args, name))
+        return filters
+
     @staticmethod
     def build_filter_conditions(params):
         """Build WHERE clause from parameters"""
-        conditions = []
-        query_params = []
-        
+        filters = FilterCompiler()
+
         # Handle specific filters
-        if params.get('state'):
-            conditions.append("state = %s")
-            query_params.append(params['state'])
-            
-        if params.get('severity'):
-            conditions.append("severity = %s")
-            query_params.append(int(params['severity']))
-            
-        if params.get('weather_condition'):
-            conditions.append("weather_condition = %s")
-            query_params.append(params['weather_condition'])
-            
-        if params.get('year'):
-            conditions.append("year = %s")
-            query_params.append(int(params['year']))
-            
-        if params.get('month'):
-            conditions.append("month = %s")
-            query_params.append(int(params['month']))
-            
-        if params.get('day'):
-            conditions.append("day = %s")
-            query_params.append(int(params['day']))
-
-        where_clause = " AND ".join(conditions) if conditions else "1=1"
-        return where_clause, query_params
-
-        
\ No newline at end of file
+        filters.equals('state', params.get('state'))
+        filters.equals('weather_condition', params.get('weather_condition'))
+        for column in ('severity', 'year', 'month', 'day'):
+            if params.get(column):
+                filters.values(column, [int(params[column])])
+
+        return filters.compile()
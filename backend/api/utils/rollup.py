@@ -0,0 +1,42 @@
+import time
+from api.utils.handlers import Query
+from config.config import Config
+
+# Built by "Postgres Data Insertion/rollup.py" after each import. Cells are
+# keyed on (state, county, city, year, month, day, hour, dow, severity,
+# weather_condition) and hold accident_count, severity_sum and the
+# min/max lat/lng of the accidents in the cell.
+ROLLUP_TABLE = 'accidents_rollup'
+
+# Aggregates over rollup cells equivalent to COUNT(*) / AVG(severity)
+ROLLUP_COUNT = "SUM(accident_count)::bigint"
+ROLLUP_AVG_SEVERITY = (
+    "(SUM(severity_sum)::numeric / "
+    "NULLIF(SUM(accident_count) FILTER (WHERE severity IS NOT NULL), 0))"
+)
+
+_available = None
+_checked_at = 0.0
+
+
+def rollup_available():
+    """Whether the rollup table exists and may be used to answer queries.
+
+    A query handler step: ``use_rollup = yield from rollup_available()``.
+    The lookup is cached for ROLLUP_CHECK_INTERVAL seconds so routes can
+    call this on every request.
+    """
+    global _available, _checked_at
+    if not Config.USE_ROLLUP:
+        return False
+    now = time.monotonic()
+    if _available is None or now - _checked_at > Config.ROLLUP_CHECK_INTERVAL:
+        result = yield Query(
+            "SELECT to_regclass(%s) IS NOT NULL as available",
+            (ROLLUP_TABLE,),
+            fetch_all=False,
+            use_cache=False
+        )
+        _available = result['available']
+        _checked_at = now
+    return _available
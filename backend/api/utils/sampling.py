@@ -0,0 +1,32 @@
+from api.utils.handlers import Query
+
+# Per-row sample key: a hash of the accident id, uniform over [0, 2**31).
+# The importer indexes this expression, so "key < threshold" picks the same
+# pseudo-random subset on every run without sorting anything.
+SAMPLE_KEY_SQL = "(hashtext(id) & 2147483647)"
+SAMPLE_KEY_RANGE = 2 ** 31
+
+SAMPLE_MODES = ('hash', 'severity')
+
+
+def sample_threshold(total, target):
+    """Sample key bound keeping about target of total rows, or None for all"""
+    if not total or total <= target:
+        return None
+    return int(SAMPLE_KEY_RANGE * target / total)
+
+
+def estimate_rows(where_clause, params):
+    """The planner's estimate of the accidents matching where_clause, as a
+    query handler step: ``total = yield from estimate_rows(...)``.
+
+    Only the query is planned, so unlike COUNT(*) the cost doesn't grow
+    with the table. The estimate comes from the table statistics, which is
+    close enough to size a sample.
+    """
+    plan = yield Query(
+        f"EXPLAIN (FORMAT JSON) SELECT 1 FROM accidents WHERE {where_clause}",
+        params,
+        fetch_all=False
+    )
+    return int(plan['QUERY PLAN'][0]['Plan']['Plan Rows'])
@@ -0,0 +1,81 @@
+import traceback
+from functools import partial
+
+from flask import Response, current_app
+
+from api.utils.access_log import record_rows, request_stats
+from config.config import Config
+
+# Newline-delimited JSON: one object per line
+NDJSON_MIME_TYPE = 'application/x-ndjson'
+
+
+def _batched(chunks):
+    """Join chunks into writes of STREAM_ITERSIZE, one per cursor fetch"""
+    batch = []
+    for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= Config.STREAM_ITERSIZE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def _compact_dumps():
+    # The app's encoder (dates, Decimals) with jsonify's compact separators
+    return partial(current_app.json.dumps, separators=(',', ':'))
+
+
+def _guarded(body):
+    # The status line has gone out by the time rows are read, so a failure
+    # can only cut the body short; log it like the routes do
+    try:
+        yield from body
+    except Exception as e:
+        print(f"Error while streaming: {str(e)}")
+        print(f"Traceback: {traceback.format_exc()}")
+
+
+def json_stream(head, key, rows, tail=None):
+    """JSON object response whose ``key`` array is written as rows arrive.
+
+    The object holds the ``head`` members, then ``key`` with one element
+    per row, then the members returned by ``tail(count)``, called once the
+    rows are exhausted. Rows are encoded exactly as jsonify would.
+    """
+    dumps = _compact_dumps()
+    stats = request_stats()
+
+    def members(values):
+        return [f"{dumps(name)}:{dumps(value)}" for name, value in values.items()]
+
+    def elements():
+        count = 0
+        for row in rows:
+            yield ("," if count else "") + dumps(row)
+            count += 1
+        record_rows(count, stats=stats)
+        yield "]" + "".join("," + member for member in members(tail(count) if tail else {}))
+
+    def body():
+        yield "{" + "".join(member + "," for member in members(head)) + f"{dumps(key)}:["
+        yield from _batched(elements())
+        yield "}"
+
+    return Response(_guarded(body()), mimetype='application/json')
+
+
+def ndjson_stream(rows):
+    """NDJSON response with a line per row, written as rows arrive"""
+    dumps = _compact_dumps()
+    stats = request_stats()
+
+    def lines():
+        count = 0
+        for row in rows:
+            yield dumps(row) + "\n"
+            count += 1
+        record_rows(count, stats=stats)
+
+    return Response(_guarded(_batched(lines())), mimetype=NDJSON_MIME_TYPE)
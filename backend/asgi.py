@@ -0,0 +1,139 @@
+"""Async serving mode.
+
+    uvicorn asgi:app --port 5000 --workers 4
+
+GET routes written as query handlers (see api/utils/handlers.py) run on
+the event loop: each request is a task that holds no thread while its
+queries wait on the async pool, so one process can keep hundreds of slow
+dashboard requests in flight. They still run inside a Flask request
+context, so before/after_request hooks, jsonify and CORS behave exactly
+as under run.py. Everything else is passed to the Flask app on a worker
+thread.
+
+Streamed responses (api/utils/streaming.py) still read their rows with
+psycopg2's server-side cursors, one chunk at a time on a worker thread.
+"""
+import asyncio
+import io
+import sys
+
+from a2wsgi import WSGIMiddleware
+from flask import request_started
+from werkzeug.exceptions import HTTPException
+
+from api.utils.async_database import close_pool, open_pool
+from api.utils.handlers import run_async
+from config.config import Config
+from run import app as flask_app
+
+wsgi_app = WSGIMiddleware(flask_app)
+
+
+def build_environ(scope):
+    """WSGI environ for a body-less ASGI HTTP request"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin-1'),
+        'PATH_INFO': scope['path'].encode().decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f"HTTP_{name}"
+        value = value.decode('latin-1')
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def match_handler(environ):
+    """(handler, view args) for a GET on a query handler route, else None"""
+    if environ['REQUEST_METHOD'] != 'GET':
+        return None
+    try:
+        endpoint, values = flask_app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None
+    handler = getattr(flask_app.view_functions.get(endpoint), 'handler', None)
+    return (handler, values) if handler else None
+
+
+async def dispatch(environ, handler, values):
+    """Flask's full_dispatch_request with the view awaited on the async pool"""
+    with flask_app.request_context(environ):
+        try:
+            try:
+                request_started.send(flask_app)
+                rv = flask_app.preprocess_request()
+                if rv is None:
+                    rv = await run_async(handler(**values))
+            except Exception as e:
+                rv = flask_app.handle_user_exception(e)
+            return flask_app.finalize_request(rv)
+        except Exception as e:
+            return flask_app.handle_exception(e)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await open_pool()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    environ = build_environ(scope) if scope['type'] == 'http' else None
+    matched = match_handler(environ) if environ else None
+    if matched is None:
+        return await wsgi_app(scope, receive, send)
+
+    response = await dispatch(environ, *matched)
+    # As werkzeug would serve it: no body on a 304, headers fixed up
+    app_iter, status, headers = response.get_wsgi_response(environ)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers]
+        })
+        if not response.is_streamed:
+            await send({'type': 'http.response.body', 'body': b''.join(app_iter)})
+            return
+        # Streamed bodies read a server-side cursor as they go; each chunk
+        # is pulled on a worker thread so the loop never waits on it
+        chunks = iter(app_iter)
+        while (chunk := await asyncio.to_thread(next, chunks, None)) is not None:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if response.is_streamed:
+            await asyncio.to_thread(response.close)
+        else:
+            response.close()
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run('asgi:app', host='0.0.0.0', port=Config.PORT)
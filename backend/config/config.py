@@ -9,4 +9,42 @@ class Config:
         "port": os.environ.get("DB_PORT", "5432")
     }
     DEBUG = os.environ.get("FLASK_DEBUG", "false").lower() == "true"
-    PORT = int(os.environ.get("PORT", 5000))
\ No newline at end of file
+    PORT = int(os.environ.get("PORT", 5000))
+
+    # Connection pool used by execute_query
+    DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", 10))
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+    DB_POOL_HEALTHCHECK_INTERVAL = float(os.environ.get("DB_POOL_HEALTHCHECK_INTERVAL", 30))
+
+    # Async pool used by the ASGI app (asgi.py). Waiting requests hold no
+    # thread, so this only needs to cover the queries Postgres runs at once
+    ASYNC_DB_POOL_MIN = int(os.environ.get("ASYNC_DB_POOL_MIN", 2))
+    ASYNC_DB_POOL_MAX = int(os.environ.get("ASYNC_DB_POOL_MAX", 50))
+
+    # Threads running a request's independent queries side by side (QueryBatch);
+    # 0 runs them one after another on the request thread
+    DB_PARALLEL_WORKERS = int(os.environ.get("DB_PARALLEL_WORKERS", 10))
+
+    # Results of STREAM_MIN_ROWS rows or more are written out as they are read
+    # from a server-side cursor, STREAM_ITERSIZE rows per round trip
+    STREAM_MIN_ROWS = int(os.environ.get("STREAM_MIN_ROWS", 10000))
+    STREAM_ITERSIZE = int(os.environ.get("STREAM_ITERSIZE", 2000))
+
+    # Answer aggregate queries from accidents_rollup when it exists
+    USE_ROLLUP = os.environ.get("USE_ROLLUP", "true").lower() == "true"
+    ROLLUP_CHECK_INTERVAL = float(os.environ.get("ROLLUP_CHECK_INTERVAL", 60))
+
+    # Query result cache in execute_query
+    QUERY_CACHE_ENABLED = os.environ.get("QUERY_CACHE_ENABLED", "true").lower() == "true"
+    QUERY_CACHE_MAX_BYTES = int(os.environ.get("QUERY_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+    QUERY_CACHE_TTL = float(os.environ.get("QUERY_CACHE_TTL", 600))
+    QUERY_CACHE_VERSION_CHECK_INTERVAL = float(os.environ.get("QUERY_CACHE_VERSION_CHECK_INTERVAL", 5))
+
+    # Access log, one JSON line per request. Failed requests are always
+    # logged; successful ones with probability ACCESS_LOG_SAMPLE_RATE.
+    # ACCESS_LOG_LEVEL=WARNING keeps only the failures
+    ACCESS_LOG_LEVEL = os.environ.get("ACCESS_LOG_LEVEL", "INFO").upper()
+    ACCESS_LOG_SAMPLE_RATE = float(os.environ.get("ACCESS_LOG_SAMPLE_RATE", 1.0))
+
+    # Cache-Control max-age for map tiles, in seconds
+    TILE_MAX_AGE = int(os.environ.get("TILE_MAX_AGE", 3600))
@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify
 from flask_cors import CORS
 from api.routes.accident_routes import accident_bp
 from api.routes.spatial_routes import spatial_bp
@@ -11,7 +11,9 @@ from api.routes.analysis_routes import analysis_bp
 from config.config import Config
 import os
 import psycopg2
-from api.utils.database import execute_query
+from api.utils.access_log import finish_request, setup_access_log, start_request
+from api.utils.database import execute_query, get_pool_stats, get_cache_stats
+from api.utils.geometry import get_county_shapes
 
 app = Flask(__name__)
 
@@ -27,7 +29,7 @@ CORS(app, resources={
 # Test database connection
 def test_db():
     try:
-        result = execute_query("SELECT 1")
+        result = execute_query("SELECT 1", use_cache=False)
         print("✅ Database connection successful")
         return True
     except Exception as e:
@@ -41,19 +43,22 @@ app.register_blueprint(state_bp)
 app.register_blueprint(county_time_bp)
 app.register_blueprint(analysis_bp)
 
+# Parse and simplify the county outlines once, before the first request
+get_county_shapes()
+
+# Structured access log in place of per-request prints
+setup_access_log()
+
 @app.before_request
 def before_request():
-    print(f"📝 Request: {request.method} {request.url}")
-    print(f"📝 Args: {request.args}")
-    print(f"📝 Headers: {request.headers}")
+    start_request()
 
 @app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', 'http://localhost:3000')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
-    print(f"📤 Response Status: {response.status}")
-    return response
+    return finish_request(response)
 
 # Test route
 @app.route('/api/test')
@@ -63,6 +68,25 @@ def test():
         'message': 'API is working'
     })
 
+# Connection pool and query cache metrics
+@app.route('/api/stats')
+def stats():
+    result = {
+        'pool': get_pool_stats(),
+        'cache': get_cache_stats()
+    }
+    # Under asgi.py the query handlers run on the async pool instead
+    try:
+        # Imported here so the Flask app runs without the async driver installed
+        from api.utils.async_database import get_async_pool_stats
+    except ImportError:
+        pass
+    else:
+        async_pool = get_async_pool_stats()
+        if async_pool is not None:
+            result['async_pool'] = async_pool
+    return jsonify(result)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', Config.PORT))
     